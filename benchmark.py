@@ -0,0 +1,356 @@
+# Benchmarks for the Matrix operations in matrix_v3.
+# Replaces the commented out datetime loops that used to live at the bottom
+# of matrix_v3.py and the hand pasted timings in check.txt / check1.txt.
+#
+# Every operation is timed over a sweep of square sizes and of tall
+# 1000 by P design matrices. The median and 95th percentile time per call and
+# the bytes allocated by one call are reported, and the results can be
+# written as JSON and compared against a stored baseline run:
+#
+#   python benchmark.py --out new.json --baseline old.json
+#
+# On a host with NumPy, --backend python times the pure Python kernels the
+# hub runs instead of the NumPy backend. On the hub, where matrix_native is
+# loaded, each compiled kernel is also timed against its pure Python version
+# and the speedup is reported.
+#
+# Runs on CPython and on MicroPython (call run() from the REPL on the hub).
+import gc
+from array import array
+import json
+import sys
+import matrix_v3 as matrix
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+SQUARE_SIZES = (2, 4, 8, 16, 32, 64)
+TALL_ROWS = 1000
+TALL_COLUMNS = (2, 4, 8)
+QUICK_SQUARE_SIZES = (2, 4, 8)
+QUICK_TALL_ROWS = 100
+# a sample is at least this long so the timer resolution doesn't dominate
+MIN_SAMPLE_US = 2000
+
+
+# Purpose: to make deterministic pseudo random data that is the same on every
+# platform, since the random module differs between ports
+# Parameters: n which is how many values to make and seed
+# returns: a list of n floats in [-1, 1)
+def make_values(n, seed=12345):
+    out = []
+    state = seed
+    for i in range(n):
+        state = (state * 1103515245 + 12345) & 0x7fffffff
+        out.append(state / 1073741824.0 - 1.0)
+    return out
+
+
+# Purpose: to make a matrix of benchmark data. Square matrices get a boosted
+# diagonal so they are well conditioned for the solvers
+# Parameters: rows and columns of the matrix and seed for the data
+# returns: the rows as a list of lists
+def make_rows(rows, columns, seed=12345):
+    values = make_values(rows * columns, seed)
+    out = [values[r*columns:(r+1)*columns] for r in range(rows)]
+    if rows == columns:
+        for i in range(rows):
+            out[i][i] += rows
+    return out
+
+
+# Purpose: to measure how many bytes one call of fn allocates
+# Parameters: fn which takes no arguments
+# returns: the bytes allocated, or None if the platform can't tell
+def measure_alloc(fn):
+    if hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        fn()
+        after = gc.mem_alloc()
+        gc.enable()
+        return after - before
+    if tracemalloc is not None:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+    return None
+
+
+# Purpose: to time fn, calling it enough times per sample that each sample
+# takes at least MIN_SAMPLE_US
+# Parameters: fn which takes no arguments and repeat which is the number of
+# samples to take
+# returns: the sorted list of per call times in microseconds
+def measure_time(fn, repeat):
+    calls = 1
+    while True:
+        start = ticks_us()
+        for i in range(calls):
+            fn()
+        elapsed = ticks_diff(ticks_us(), start)
+        if elapsed >= MIN_SAMPLE_US or calls >= 1 << 16:
+            break
+        calls *= 4
+    # the calibration runs double as warm up and aren't kept
+    samples = []
+    for s in range(repeat):
+        gc.collect()
+        start = ticks_us()
+        for i in range(calls):
+            fn()
+        samples.append(ticks_diff(ticks_us(), start) / calls)
+    samples.sort()
+    return samples
+
+
+# Purpose: to pick a percentile from sorted samples
+# Parameters: samples which is sorted and fraction which is in [0, 1]
+# returns: the sample at that fraction of the way through
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+# Purpose: to list the operations to benchmark on a square matrix
+# Parameters: n which is the size of the matrix
+# returns: a list of (name, fn) pairs
+def square_cases(n):
+    rows = make_rows(n, n)
+    a = matrix.Matrix(rows)
+    b = matrix.Matrix(make_rows(n, n, 777))
+    at = a.T()
+    return [
+        ('construct', lambda: matrix.Matrix(rows)),
+        ('eye', lambda: matrix.Matrix.eye(n)),
+        ('T', lambda: a.T()),
+        ('clone', lambda: a.clone()),
+        ('clone_transposed', lambda: at.clone()),
+        ('get', lambda: a.get(n - 1, n - 1)),
+        ('add', lambda: a + b),
+        ('mul', lambda: a * b),
+        ('mul_transposed', lambda: at * b),
+        ('mul_scalar', lambda: a * 2.5),
+        ('determinant', lambda: a.determinant()),
+        ('get_inverse', lambda: a.get_inverse()),
+        ('factorize', lambda: matrix.LU(a)),
+        ('cholesky', lambda: (a + at).cholesky()),
+    ]
+
+
+# Purpose: to list the operations to benchmark on a tall design matrix
+# Parameters: rows and columns of the design matrix
+# returns: a list of (name, fn) pairs
+def tall_cases(rows, columns):
+    data = make_rows(rows, columns)
+    x = matrix.Matrix(data)
+    y = matrix.Matrix(make_values(rows, 999))
+    xb = x.add_bias_ones()
+    expansion = matrix.PolynomialFeatures(columns, 2)
+    return [
+        ('construct', lambda: matrix.Matrix(data)),
+        ('clone', lambda: x.clone()),
+        ('add', lambda: x + x),
+        ('add_bias_ones', lambda: x.add_bias_ones()),
+        ('polynomialize', lambda: x.polynomialize(2)),
+        ('poly_features', lambda: expansion.transform(x)),
+        ('xT_mul_x', lambda: x.T() * x),
+        ('gram', lambda: x.gram()),
+        ('tmul', lambda: x.tmul(y)),
+        ('lin_regression', lambda: matrix.lin_regression(x, y)),
+        ('poly_regression', lambda: matrix.poly_regression(x, y, 2)),
+        ('lstsq_qr', lambda: matrix.lstsq(xb, y, 'qr')),
+    ]
+
+
+# Purpose: to list the kernels matrix_native compiles, each as the pure
+# Python kernel and the compiled one called on the same n by n problem
+# Parameters: n which is the size of the problem and native which is the
+# matrix_native module
+# returns: a list of (name, python fn, native fn) triples
+def kernel_cases(n, native):
+    rows = make_rows(n, n)
+    a = matrix.Matrix(rows).arr
+    b = matrix.Matrix(make_rows(n, n, 777)).arr
+    ai = matrix.Matrix(rows).astype('i').arr
+    spd = (matrix.Matrix(rows) + matrix.Matrix(rows).T()).arr
+    out = matrix.zeros_array('f', n*n)
+    outi = matrix.zeros_array('i', n*n)
+    L = matrix.zeros_array('f', n*(n+1)//2)
+    python = matrix.PYTHON_KERNELS
+    cases = []
+    for name, args in (
+            ('matmul_kernel', (a, 0, n, 1, b, 0, n, 1, out, n, n, n)),
+            ('gram_kernel', (a, 0, n, 1, n, n, out)),
+            ('copy_strided', (a, 0, 1, n, n, n, out)),
+            ('elementwise_kernel', ('add', a, 0, n, 1, b, 0, n, 1, out, n, n)),
+            ('cholesky_decompose', (spd, n, L))):
+        cases.append((name, lambda f=python[name], x=args: f(*x),
+                      lambda f=getattr(native, name), x=args: f(*x)))
+    # factoring works in place, so both sides factor a fresh copy
+    cases.append(('lu_decompose',
+                  lambda: python['lu_decompose'](array('f', a), n),
+                  lambda: native.lu_decompose(array('f', a), n)))
+    # the viper kernels against the Python kernel they stand in for
+    copy = python['copy_strided']
+    cases.append(('copy_strided32', lambda: copy(a, 0, 1, n, n, n, out),
+                  lambda: native.copy_strided32(a, 0, 1, n, n, n, out)))
+    add = python['elementwise_kernel']
+    cases.append(('add_int32',
+                  lambda: add('add', ai, 0, n, 1, ai, 0, n, 1, outi, n, n),
+                  lambda: native.add_int32(ai, 0, n, 1, ai, 0, n, 1, outi, n, n)))
+    return cases
+
+
+# Purpose: to time each compiled kernel against its pure Python version,
+# which only happens where matrix_native imports, i.e. on the hub
+# Parameters: repeat, quick and verbose as for run
+# returns: a dict from "kernel_name/size" to the compiled kernel's median_us
+# and p95_us, the Python kernel's python_us and the speedup between them
+def run_kernels(repeat=7, quick=False, verbose=True):
+    native = matrix.matrix_native
+    results = {}
+    if native is None:
+        if verbose:
+            print('matrix_native is not loaded, skipping the kernel speedups')
+        return results
+    for n in (QUICK_SQUARE_SIZES if quick else SQUARE_SIZES):
+        size = '%dx%d' % (n, n)
+        for name, python_fn, native_fn in kernel_cases(n, native):
+            python_us = percentile(measure_time(python_fn, repeat), 0.5)
+            samples = measure_time(native_fn, repeat)
+            key = 'kernel_' + name + '/' + size
+            results[key] = {
+                'median_us': percentile(samples, 0.5),
+                'p95_us': percentile(samples, 0.95),
+                'alloc_bytes': None,
+                'python_us': python_us,
+                'speedup': python_us / max(percentile(samples, 0.5), 1e-9),
+            }
+            if verbose:
+                print('%-24s %-9s python %10.1f us  native %10.1f us  %6.2fx'
+                      % (name, size, python_us, results[key]['median_us'],
+                         results[key]['speedup']))
+    return results
+
+
+# Purpose: to run the whole benchmark sweep
+# Parameters: repeat which is the number of samples per operation, quick
+# which limits the sweep to small sizes for a fast check and verbose which
+# prints each result as it is measured
+# returns: a dict from "operation/size" to its median_us, p95_us and
+# alloc_bytes
+def run(repeat=7, quick=False, verbose=True):
+    results = {}
+    squares = QUICK_SQUARE_SIZES if quick else SQUARE_SIZES
+    tall_rows = QUICK_TALL_ROWS if quick else TALL_ROWS
+    groups = [('%dx%d' % (n, n), square_cases(n)) for n in squares]
+    groups += [('%dx%d' % (tall_rows, p), tall_cases(tall_rows, p))
+               for p in TALL_COLUMNS]
+    for size, cases in groups:
+        for name, fn in cases:
+            samples = measure_time(fn, repeat)
+            key = name + '/' + size
+            results[key] = {
+                'median_us': percentile(samples, 0.5),
+                'p95_us': percentile(samples, 0.95),
+                'alloc_bytes': measure_alloc(fn),
+            }
+            if verbose:
+                print('%-24s %-9s median %10.1f us  p95 %10.1f us  alloc %s'
+                      % (name, size, results[key]['median_us'],
+                         results[key]['p95_us'], results[key]['alloc_bytes']))
+    return results
+
+
+# Purpose: to compare a run against a stored baseline
+# Parameters: results and baseline which are dicts as returned by run, and
+# threshold which is the slowdown ratio of the median that counts as a
+# regression
+# returns: a list of (key, ratio) for every regressed operation
+def compare(results, baseline, threshold=1.25):
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old = baseline[key]['median_us']
+        if old <= 0:
+            continue
+        ratio = results[key]['median_us'] / old
+        if ratio > threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+
+# Purpose: to run the benchmarks from the command line
+# Parameters: argv which is the list of command line arguments
+# returns: the process exit status, 1 if the baseline comparison found a
+# regression
+def main(argv):
+    out = None
+    baseline = None
+    threshold = 1.25
+    repeat = 7
+    quick = False
+    backend = None
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == '--out':
+            i += 1
+            out = argv[i]
+        elif arg == '--baseline':
+            i += 1
+            baseline = argv[i]
+        elif arg == '--threshold':
+            i += 1
+            threshold = float(argv[i])
+        elif arg == '--repeat':
+            i += 1
+            repeat = int(argv[i])
+        elif arg == '--quick':
+            quick = True
+        elif arg == '--backend':
+            i += 1
+            backend = argv[i]
+        i += 1
+    if backend:
+        matrix.set_backend(backend)
+    results = run(repeat, quick)
+    results.update(run_kernels(repeat, quick))
+    if out:
+        with open(out, 'w') as f:
+            json.dump({'platform': sys.platform,
+                       'implementation': sys.implementation.name,
+                       'backend': matrix.get_backend(),
+                       'results': results}, f)
+    if baseline:
+        with open(baseline) as f:
+            old = json.load(f)['results']
+        regressions = compare(results, old, threshold)
+        for key, ratio in regressions:
+            print('REGRESSION %-34s %.2fx slower' % (key, ratio))
+        if regressions:
+            return 1
+        print('no regressions against', baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -4,7 +4,7 @@
 # Copy the contents of install_uartremote.py into an empty SPIKE Prime project
 # And run to install
 
-import binascii, mpy_cross, time
+import binascii, mpy_cross
 import hashlib
 import os
 from functools import partial
@@ -15,6 +15,13 @@ INSTALLER = 'install_mpy_matrix_tools.py'
 BASE_SCRIPT = 'base_script.py'
 SKIP_FILES = ['__pycache__', 'matrix.py']
 CHUNK_SIZE = 2**8
+# matrix_native's @micropython.native and viper kernels are compiled to
+# machine code for this architecture. The hub's STM32F413 is a Cortex-M4
+# with a single precision FPU, and MicroPython refuses a native .mpy built
+# for any other architecture
+MARCH = '-march=armv7emsp'
+
+os.makedirs(MPY_LIB, exist_ok=True)
 
 files = [f for f in os.listdir(LIB) if f not in SKIP_FILES and ".py" in f ]
 encoded = []
@@ -22,8 +29,8 @@ encoded = []
 for f in files:
     out_file = f.split(".")[0]+".mpy"
     out_file_loc = MPY_LIB+out_file
-    mpy_cross.run('-march=armv6',LIB+f,'-o', out_file_loc)
-    time.sleep(0.5)
+    if mpy_cross.run(MARCH,LIB+f,'-o', out_file_loc).wait() != 0:
+        raise SystemExit('mpy-cross failed on '+f)
     with open(out_file_loc,'rb') as mpy_file:
         file_hash = hashlib.sha256(mpy_file.read()).hexdigest()
     chunks = []
@@ -1,7 +1,7 @@
 from spike import PrimeHub, LightMatrix, Button, StatusLight, ForceSensor, MotionSensor, Speaker, ColorSensor, App, DistanceSensor, Motor, MotorPair
 from spike.control import wait_for_seconds, wait_until, Timer
 from math import *
-import matrix
+import matrix_v3 as matrix
 
 hub = PrimeHub()
 ports = ['A', 'B', 'C', 'D', 'E', 'F']
@@ -31,7 +31,9 @@ def clear_buttons():
 
 def setup_get_sensor_data(color_sensor):
     #return lambda : (color_sensor.get_rgb_intensity()[0]*1024/(color_sensor.get_rgb_intensity()[3]+1),color_sensor.get_rgb_intensity()[1]*1024/(color_sensor.get_rgb_intensity()[3]+1))
-    return lambda : list(color_sensor.get_rgb_intensity()[0:3])
+    # The models only read the first three entries (r, g, b), so the reading
+    # is passed through as is rather than sliced into a new list every tick
+    return color_sensor.get_rgb_intensity
 
 
 def train_menu():
@@ -49,10 +51,11 @@ def train_menu():
                 hub.light_matrix.show_image('GO_RIGHT')
 
 
+# Samples are folded into the fits as they are taken instead of being kept
+# in lists, so training memory doesn't grow with the number of samples
 def train(get_sensor_data, motor, motor2 = None):
-    xs = []
-    y1s = []
-    y2s = []
+    model1 = matrix.OnlineRegression(3)
+    model2 = matrix.OnlineRegression(3)
     choices = ['CHESSBOARD', 'GO_RIGHT']
     choice = 0
     hub.light_matrix.show_image(choices[choice])
@@ -69,11 +72,11 @@ def train(get_sensor_data, motor, motor2 = None):
                 hub.speaker.beep(90, 0.15)
                 hub.speaker.beep(94, 0.15)
                 hub.speaker.beep(98, 0.15)
-                return xs, y1s, y2s
-            xs.append(get_sensor_data())
-            y1s.append(motor.get_position())
+                return model1, model2
+            sample = get_sensor_data()
+            model1.add_sample(sample, motor.get_position())
             if motor2:
-                y2s.append(get_position())
+                model2.add_sample(sample, motor2.get_position())
 
             hub.light_matrix.show_image('YES')
             hub.speaker.beep(90, 0.15)
@@ -97,15 +100,26 @@ get_sensor_data = setup_get_sensor_data(color)
 
 hub.motion_sensor.was_gesture('tapped')
 
+# The fitted models are saved after training and loaded on the next run, so
+# the hub doesn't have to be retrained after every reboot
+MODEL_FILE = 'model.bin'
+
 train_flag = train_menu()
 if train_flag:
-    xs, y1s, y2s = train(get_sensor_data, motor, motor2)
-
-print(xs)
-print(y1s)
-xs = matrix.Matrix(xs)
-ys = matrix.Matrix(y1s)
-m1eq = matrix.lin_regression(xs, ys)
+    model1, model2 = train(get_sensor_data, motor, motor2)
+    print("trained on", model1.samples, "samples")
+    m1eq = model1.coefficients()
+    if motor2:
+        m2eq = model2.coefficients()
+    with open(MODEL_FILE, 'wb') as f:
+        m1eq.save(f)
+        if motor2:
+            m2eq.save(f)
+else:
+    with open(MODEL_FILE, 'rb') as f:
+        m1eq = matrix.Matrix.load(f)
+        if motor2:
+            m2eq = matrix.Matrix.load(f)
 
 hub.light_matrix.off()
 hub.light_matrix.show_image('DIAMOND')
@@ -115,13 +129,11 @@ status = ["azure","blue","cyan","green","orange","pink","red","violet","yellow",
 while True:
     hub.status_light.on(status[rounds])
     raw = get_sensor_data()
-    raw.insert(0,1)
-    current = matrix.Matrix(raw).T()
-    print(current)
-    target_angle1 = int((current * m1eq).get(0,0)) % 360
+    # dot_vec adds the bias term itself, no matrices are built per tick
+    target_angle1 = int(m1eq.dot_vec(raw)) % 360
     print(target_angle1)
     if motor2:
-        target_angle2 = (current * m2eq).get(0,0)
+        target_angle2 = m2eq.dot_vec(raw)
         proportional_adjust(target_angle2, motor2)
     else:
         motor.run_to_position(target_angle1)
@@ -10,17 +10,49 @@ def get_matrix_minor(arr,i,j,n):
         out = out + a[i]
     return out
 
+def lu_decompose(arr, n, piv=None):
+    "Packed in-place LU with partial pivoting. Returns the permutation sign"
+    sign = 1
+    for k in range(n):
+        p = k
+        big = abs(arr[k*n+k])
+        for i in range(k+1, n):
+            v = abs(arr[i*n+k])
+            if v > big:
+                big = v
+                p = i
+        if piv is not None:
+            piv[k] = p
+        if p != k:
+            kn = k*n
+            pn = p*n
+            for j in range(n):
+                t = arr[kn+j]
+                arr[kn+j] = arr[pn+j]
+                arr[pn+j] = t
+            sign = -sign
+        pivot = arr[k*n+k]
+        if pivot == 0:
+            continue
+        kn = k*n
+        for i in range(k+1, n):
+            ikn = i*n
+            f = arr[ikn+k] / pivot
+            arr[ikn+k] = f
+            if f != 0:
+                for j in range(k+1, n):
+                    arr[ikn+j] -= f * arr[kn+j]
+    return sign
+
 def determinant_helper(arr, n):
-    #base case for 2x2 matrix
-    if n == 1:
-        return arr[0]
-    if n == 2:
-        return arr[0]*arr[3]-arr[2]*arr[1]
-    determinant = 0
-    for c in range(n):
-        a = ((-1)**c) * arr[c]
-        b = a * determinant_helper(get_matrix_minor(arr,0,c,n), n-1)
-        determinant += b
+    # product of the LU pivots, factored on a scratch copy of arr
+    if len(arr) != n*n:
+        raise ValueError('expected %d entries for a %dx%d matrix, got %d'
+                         % (n*n, n, n, len(arr)))
+    scratch = array('f', arr)
+    determinant = lu_decompose(scratch, n)
+    for k in range(n):
+        determinant *= scratch[k*n+k]
     return determinant
 
 def transpose_matrix(arr, rows, columns, out):
@@ -135,7 +167,7 @@ class Matrix:
     def add_bias_ones(self):
         out = Matrix(self.type_code)
         if self.transposed:
-            return #Fix this
+            return self.clone().add_bias_ones()
 
         for i in range(len(self.arr)):
             if i % self.columns == 0:
@@ -220,24 +252,6 @@ class Matrix:
         out +="]"
         return out
 
-a = Matrix('i', [[3,8],[4,6]])
-b = Matrix('i', [[1,2],[3,4]])
-c = Matrix('i', [[1,2,5],[3,4,2],[3,2,7]])
-# print(a + b)
-# print(a * b)
-# a.T()
-# print(a.clone())
-# print(b.get_inverse())
-mv = memoryview(c.arr)
-# print(get_matrix_minor(mv, 1,1,3))
-# print(c.determinant())
-# print(c.get_inverse())
-
-
-x = Matrix('f', [1,2,5]).T().clone()
-y = Matrix('f', [5, 10, 25]).T()
-
-
 def lin_regression(x, y):
     x = x.add_bias_ones()
     xT = x.T()
@@ -254,8 +268,6 @@ def poly_regression(x, y, degree):
         alpha.add_row([.0000001 if i == j else 0 for j in range(x.get_columns())])
     return (alpha + xT * x).get_inverse() * xT * y.T()
 
-print(lin_regression(x, y))
-
 
 # def getMatrixInverse(m):
 #     determinant = getMatrixDeternminant(m)
@@ -278,10 +290,28 @@ print(lin_regression(x, y))
 #             cofactors[r][c] = cofactors[r][c]/determinant
 #     return cofactors
 
-x = Matrix([67.77472353218393, 88.13098577413399, 42.52930638931034, 37.5432806277281, 1.9198458039374589, 95.64210152543843, 26.949504997381247, 4.009564303303248, 8.80509597940209, 39.79363879960982, 35.22092471535084, 39.587780219127154, 45.51274216523215, 54.12805293908667, 47.18181666996103, 93.02835319332387, 31.13950562616774, 59.7201510037116, 53.80654305953264, 28.287518357163055, 60.907829142815714, 55.76053745287567, 85.95283416834502, 90.59405475757596, 9.171543655741898, 23.025560679907777, 60.99942588993682, 37.49909274641523, 12.382262103698116, 48.1340567049508, 59.810056065284186, 55.69024159681184, 26.472862346215685, 55.64166467054768, 98.25844497890856, 67.45911742045018, 35.70496846044291, 34.53169412582007, 84.34463972723368, 61.613497631901915, 66.50117081869747, 53.66378204285315, 52.51150387842664, 75.24835517166078, 58.08863674988469, 17.82671979420205, 74.87713609834073, 32.001925460763466, 3.2125461538568656, 19.334962956074985, 49.847395753673204, 1.191178612719479, 9.880892601113356, 95.52218273763998, 27.807248036544173, 16.102315812701406, 5.777375785533733, 9.44901880427782, 6.017851911013605, 49.081003991780825, 22.471509132751898, 51.54633680998347, 7.225774728437839, 14.605177598825103, 90.07781382345678, 74.90636996433466, 1.7946030180889916, 46.15424242576249, 12.845219231094863, 11.914080644846049, 90.08027263782967, 22.493566306822455, 53.5641400860013, 97.63601172202887, 32.78747204720162, 69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128, 19.801177481341924, 16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224, 24.657078293121803, 44.62451863254328, 46.36020966840929, 42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871, 23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609])
-
 
-st = datetime.datetime.now()
-out = inverse_helper(x.arr, 10)
-et = datetime.datetime.now()
-print(et - st)
+if __name__ == '__main__':
+    a = Matrix('i', [[3,8],[4,6]])
+    b = Matrix('i', [[1,2],[3,4]])
+    c = Matrix('i', [[1,2,5],[3,4,2],[3,2,7]])
+    # print(a + b)
+    # print(a * b)
+    # a.T()
+    # print(a.clone())
+    # print(b.get_inverse())
+    mv = memoryview(c.arr)
+    # print(get_matrix_minor(mv, 1,1,3))
+    # print(c.determinant())
+    # print(c.get_inverse())
+
+    x = Matrix('f', [1,2,5]).T().clone()
+    y = Matrix('f', [5, 10, 25]).T()
+    print(lin_regression(x, y))
+
+    x = Matrix('f', [67.77472353218393, 88.13098577413399, 42.52930638931034, 37.5432806277281, 1.9198458039374589, 95.64210152543843, 26.949504997381247, 4.009564303303248, 8.80509597940209, 39.79363879960982, 35.22092471535084, 39.587780219127154, 45.51274216523215, 54.12805293908667, 47.18181666996103, 93.02835319332387, 31.13950562616774, 59.7201510037116, 53.80654305953264, 28.287518357163055, 60.907829142815714, 55.76053745287567, 85.95283416834502, 90.59405475757596, 9.171543655741898, 23.025560679907777, 60.99942588993682, 37.49909274641523, 12.382262103698116, 48.1340567049508, 59.810056065284186, 55.69024159681184, 26.472862346215685, 55.64166467054768, 98.25844497890856, 67.45911742045018, 35.70496846044291, 34.53169412582007, 84.34463972723368, 61.613497631901915, 66.50117081869747, 53.66378204285315, 52.51150387842664, 75.24835517166078, 58.08863674988469, 17.82671979420205, 74.87713609834073, 32.001925460763466, 3.2125461538568656, 19.334962956074985, 49.847395753673204, 1.191178612719479, 9.880892601113356, 95.52218273763998, 27.807248036544173, 16.102315812701406, 5.777375785533733, 9.44901880427782, 6.017851911013605, 49.081003991780825, 22.471509132751898, 51.54633680998347, 7.225774728437839, 14.605177598825103, 90.07781382345678, 74.90636996433466, 1.7946030180889916, 46.15424242576249, 12.845219231094863, 11.914080644846049, 90.08027263782967, 22.493566306822455, 53.5641400860013, 97.63601172202887, 32.78747204720162, 69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128, 19.801177481341924, 16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224, 24.657078293121803, 44.62451863254328, 46.36020966840929, 42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871, 23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609])
+
+    st = datetime.datetime.now()
+    out = inverse_helper(x.arr, 10)
+    et = datetime.datetime.now()
+    print(et - st)
@@ -0,0 +1,195 @@
+# Streams large training sets from disk into matrix_v3 fits on the host.
+#
+#   data = matrix_dataset.Dataset('sweep.bin', targets=1)
+#   m1eq = matrix_dataset.fit(data, degree=2, scale='standard')
+#   m1eq.save('model.bin')
+#
+# A dataset file is either one saved with Matrix.save, whose header gives the
+# type and the number of columns, or a headerless row major file of raw
+# array entries such as a logger appends to, in which case the columns and
+# type code are given. The last targets columns of each row are the targets
+# and the rest are the features. The file is memory mapped when it can be,
+# otherwise it is read a chunk at a time into one reused buffer. Either way
+# the fits only ever hold one chunk of rows plus p by p accumulators, so
+# memory is bounded by chunk_rows and not by the size of the file.
+import matrix_v3 as matrix
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+
+class Dataset:
+    # A row major file of samples read in chunks of chunk_rows rows.
+    # columns and type_code describe a headerless file and are read from the
+    # header of a file written by Matrix.save. offset is the number of bytes
+    # to skip before the first row of a headerless file
+    def __init__(self, path, columns=None, type_code='f', targets=1,
+                 chunk_rows=4096, offset=0, use_mmap=True):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.file = open(path, 'rb')
+        # the rows a saved matrix says it has, anything after them is another
+        # matrix or unrelated data and not samples
+        rows = None
+        if columns is None:
+            header = matrix.Matrix.load_header(self.file)
+            type_code, flags, rows, columns = header
+            if flags & matrix.TRANSPOSED:
+                raise ValueError('a dataset has to be saved row major')
+            offset = matrix.HEADER_SIZE
+        if type_code not in matrix.ITEMSIZE:
+            raise ValueError('type_code should be one of ' + matrix.PROMOTION)
+        if targets >= columns:
+            raise ValueError('a dataset needs at least one feature column')
+        itemsize = matrix.ITEMSIZE[type_code]
+        if offset % itemsize:
+            raise ValueError('offset should be a whole number of entries')
+        self.file.seek(0, 2)
+        size = self.file.tell() - offset
+        self.type_code = type_code
+        self.columns = columns
+        self.targets = targets
+        self.features = columns - targets
+        self.offset = offset
+        # a logger may have been stopped part way through a row
+        self.rows = size // (itemsize * columns)
+        if rows is not None:
+            self.rows = min(rows, self.rows)
+        # the samples as one zero copy matrix when the file can be mapped.
+        # The map is cut off after the last row, so neither a partial entry
+        # nor whatever follows the samples is read as part of them
+        self.map = None
+        self.data = None
+        if use_mmap and mmap is not None and self.rows:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            end = offset + self.rows * columns * itemsize
+            self.data = matrix.Matrix.from_buffer(
+                memoryview(self.map)[:end], self.rows, columns, type_code,
+                offset // itemsize)
+
+    # Purpose: to go through the samples a chunk at a time
+    # Parameters: self which is the Dataset class
+    # returns: a generator of (x, y) pairs, x holding the features and y the
+    # targets of up to chunk_rows samples. Both are views of the mapped file
+    # or of one reused buffer, so they are only valid until the next chunk
+    def chunks(self):
+        features = self.features
+        targets = self.targets
+        if self.data is not None:
+            for start in range(0, self.rows, self.chunk_rows):
+                n = min(self.chunk_rows, self.rows - start)
+                yield (self.data.block(start, 0, n, features),
+                       self.data.block(start, features, n, targets))
+            return
+        columns = self.columns
+        row_bytes = matrix.ITEMSIZE[self.type_code] * columns
+        buf = matrix.Matrix.zeros(self.chunk_rows, columns, self.type_code)
+        self.file.seek(self.offset)
+        remaining = self.rows
+        while remaining > 0:
+            n = min(self.chunk_rows, remaining)
+            view = memoryview(buf.arr)[:n * columns]
+            if self.file.readinto(view) != n * row_bytes:
+                raise ValueError('dataset file is truncated')
+            remaining -= n
+            yield buf.block(0, 0, n, features), buf.block(0, features, n, targets)
+
+    # Purpose: to let go of the file and the mapping
+    # Parameters: self which is the Dataset class
+    # returns: none
+    def close(self):
+        self.data = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # a chunk is still held somewhere, the mapping goes with it
+                pass
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# Purpose: to fit a Scaler to every sample in one streaming pass
+# Parameters: dataset which is a Dataset and mode which is 'standard' or
+# 'minmax'
+# returns: the fitted Scaler
+def fit_scaler(dataset, mode='standard'):
+    scaler = matrix.Scaler(dataset.features, mode)
+    for x, y in dataset.chunks():
+        scaler.partial_fit(x)
+    return scaler
+
+
+# Purpose: to accumulate the normal equations of an expansion of the
+# features, expanding and multiplying one chunk at a time
+# Parameters: dataset which is a Dataset and expansion which is a
+# PolynomialFeatures over its features
+# returns: the gram matrix xT * x and xT * y of the expanded features, summed
+# in 'd' so millions of rows don't wash out the float32 chunk sums
+def normal_equations(dataset, expansion):
+    width = expansion.width
+    gram = matrix.Matrix.zeros(width, width, 'd')
+    xty = matrix.Matrix.zeros(width, dataset.targets, 'd')
+    expanded = None
+    chunk_gram = None
+    chunk_xty = None
+    for x, y in dataset.chunks():
+        expanded = expansion.transform(x, expanded)
+        chunk_gram = expanded.gram(chunk_gram)
+        chunk_xty = expanded.tmul(y, chunk_xty)
+        gram.iadd(chunk_gram)
+        xty.iadd(chunk_xty)
+    return gram, xty
+
+
+# Purpose: to rotate every expanded sample into a Givens QR factorization,
+# which never forms xT * x and so keeps the accuracy the normal equations
+# lose on badly conditioned features
+# Parameters: dataset which is a Dataset and expansion which is a
+# PolynomialFeatures over its features
+# returns: the GivensQR, ready to solve
+def qr_factor(dataset, expansion):
+    qr = matrix.GivensQR(expansion.width, dataset.targets,
+                         matrix.float_type(dataset.type_code))
+    expanded = None
+    for x, y in dataset.chunks():
+        expanded = expansion.transform(x, expanded)
+        qr.add_rows(expanded, y)
+    return qr
+
+
+# Purpose: to fit lin_regression or poly_regression to a dataset too big to
+# load as one matrix
+# Parameters: dataset which is a Dataset, degree, interactions and scale as
+# for poly_regression, where degree 1 is lin_regression, and method which is
+# 'normal' or 'qr'. scale costs one extra pass over the file
+# returns: the coefficients on the raw features, laid out like the result of
+# poly_regression, or None if the samples don't determine them
+def fit(dataset, degree=1, method='normal', interactions=False, scale=None):
+    scaler = None
+    if scale is not None:
+        scaler = fit_scaler(dataset, scale)
+    expansion = matrix.PolynomialFeatures(dataset.features, degree,
+                                          interactions, scaler=scaler)
+    if method == 'qr':
+        c = qr_factor(dataset, expansion).solve()
+    elif method == 'normal':
+        gram, xty = normal_equations(dataset, expansion)
+        c = matrix.solve_normal(gram.iadd(matrix.get_alpha(expansion.width)),
+                                xty)
+    else:
+        raise ValueError("method should be 'qr' or 'normal'")
+    if c is None:
+        return None
+    if scaler is not None:
+        c = expansion.fold(c)
+    return c.astype(matrix.float_type(dataset.type_code))
@@ -0,0 +1,336 @@
+# The hot kernels of matrix_v3 compiled to machine code for the hub.
+#
+# matrix_v3 tries to import this module and, when it can, swaps these in for
+# its pure Python kernels. Importing micropython fails on CPython, so on a
+# host the import fails cleanly and the Python kernels are used. Each
+# function here takes exactly the arguments of the matrix_v3 function of the
+# same name, so results are the same either way.
+#
+# The float kernels use @micropython.native: the loops and the index
+# arithmetic become machine code, while the float values are still Python
+# objects. Copies, and the arithmetic on 'i' arrays, use @micropython.viper
+# and read the buffers through ptr16/ptr32 as raw machine words, which skips
+# the objects entirely. Viper has no floats, so those kernels only move
+# float bits without doing any maths on them. The installer compiles this
+# file with mpy-cross -march=armv7emsp, since native code has to be built
+# for the hub's Cortex-M4. If it can't be loaded anyway, matrix_v3 falls
+# back to its Python kernels.
+import micropython
+from math import sqrt
+
+
+# Purpose: matrix_v3.lu_decompose compiled to machine code
+# Parameters: arr, n and piv as for matrix_v3.lu_decompose
+# returns: the sign of the row permutation
+@micropython.native
+def lu_decompose(arr, n, piv=None):
+    sign = 1
+    for k in range(n):
+        p = k
+        big = abs(arr[k*n+k])
+        for i in range(k+1, n):
+            v = abs(arr[i*n+k])
+            if v > big:
+                big = v
+                p = i
+        if piv is not None:
+            piv[k] = p
+        if p != k:
+            kn = k*n
+            pn = p*n
+            for j in range(n):
+                t = arr[kn+j]
+                arr[kn+j] = arr[pn+j]
+                arr[pn+j] = t
+            sign = -sign
+        pivot = arr[k*n+k]
+        if pivot == 0:
+            continue
+        kn = k*n
+        for i in range(k+1, n):
+            ikn = i*n
+            f = arr[ikn+k] / pivot
+            arr[ikn+k] = f
+            if f != 0:
+                for j in range(k+1, n):
+                    arr[ikn+j] -= f * arr[kn+j]
+    return sign
+
+
+# Purpose: matrix_v3.lu_solve compiled to machine code
+# Parameters: lu, n, x, offset and stride as for matrix_v3.lu_solve
+# returns: x
+@micropython.native
+def lu_solve(lu, n, x, offset=0, stride=1):
+    nn = n*n
+    for k in range(n):
+        p = int(lu[nn+k])
+        if p != k:
+            t = x[offset+k*stride]
+            x[offset+k*stride] = x[offset+p*stride]
+            x[offset+p*stride] = t
+    for i in range(n):
+        s = x[offset+i*stride]
+        for j in range(i):
+            s -= lu[i*n+j] * x[offset+j*stride]
+        x[offset+i*stride] = s
+    for i in range(n-1, -1, -1):
+        s = x[offset+i*stride]
+        for j in range(i+1, n):
+            s -= lu[i*n+j] * x[offset+j*stride]
+        x[offset+i*stride] = s / lu[i*n+i]
+    return x
+
+
+# Purpose: matrix_v3.cholesky_decompose compiled to machine code
+# Parameters: arr, n and out as for matrix_v3.cholesky_decompose
+# returns: True, or False if arr is not positive definite
+@micropython.native
+def cholesky_decompose(arr, n, out):
+    for i in range(n):
+        ii = i*(i+1)//2
+        for j in range(i+1):
+            jj = j*(j+1)//2
+            s = arr[i*n+j]
+            for k in range(j):
+                s -= out[ii+k] * out[jj+k]
+            if i == j:
+                if s <= 0:
+                    return False
+                out[ii+i] = sqrt(s)
+            else:
+                out[ii+j] = s / out[jj+j]
+    return True
+
+
+# Purpose: matrix_v3.cholesky_solve compiled to machine code
+# Parameters: L, n, x, offset and stride as for matrix_v3.cholesky_solve
+# returns: x
+@micropython.native
+def cholesky_solve(L, n, x, offset=0, stride=1):
+    for i in range(n):
+        ii = i*(i+1)//2
+        s = x[offset+i*stride]
+        for k in range(i):
+            s -= L[ii+k] * x[offset+k*stride]
+        x[offset+i*stride] = s / L[ii+i]
+    for i in range(n-1, -1, -1):
+        s = x[offset+i*stride]
+        for k in range(i+1, n):
+            s -= L[k*(k+1)//2+i] * x[offset+k*stride]
+        x[offset+i*stride] = s / L[i*(i+1)//2+i]
+    return x
+
+
+# Purpose: matrix_v3.matmul_kernel compiled to machine code
+# Parameters: as for matrix_v3.matmul_kernel
+# returns: out
+@micropython.native
+def matmul_kernel(a, ao, ars, acs, b, bo, brs, bcs, out, rows, inner, columns):
+    o = 0
+    for r in range(rows):
+        arow = ao + r*ars
+        for c in range(columns):
+            ia = arow
+            ib = bo + c*bcs
+            s = 0
+            for k in range(inner):
+                s += a[ia] * b[ib]
+                ia += acs
+                ib += brs
+            out[o] = s
+            o += 1
+    return out
+
+
+# Purpose: matrix_v3.gram_kernel compiled to machine code
+# Parameters: as for matrix_v3.gram_kernel
+# returns: out
+@micropython.native
+def gram_kernel(a, ao, ars, acs, rows, columns, out):
+    for i in range(columns):
+        ci = ao + i*acs
+        for j in range(i, columns):
+            ia = ci
+            ib = ao + j*acs
+            s = 0
+            for k in range(rows):
+                s += a[ia] * a[ib]
+                ia += ars
+                ib += ars
+            out[i*columns+j] = s
+            out[j*columns+i] = s
+    return out
+
+
+# Purpose: matrix_v3.copy_strided compiled to machine code, for arrays of
+# any type code
+# Parameters: as for matrix_v3.copy_strided
+# returns: out
+@micropython.native
+def copy_strided(arr, ao, ars, acs, rows, columns, out):
+    o = 0
+    for r in range(rows):
+        i = ao + r*ars
+        for c in range(columns):
+            out[o] = arr[i]
+            o += 1
+            i += acs
+    return out
+
+
+# Purpose: matrix_v3.elementwise_kernel compiled to machine code
+# Parameters: as for matrix_v3.elementwise_kernel
+# returns: out
+@micropython.native
+def elementwise_kernel(op, a, ao, ars, acs, b, bo, brs, bcs, out, rows, columns):
+    if ars == columns*acs and brs == columns*bcs:
+        columns *= rows
+        rows = 1
+    o = 0
+    for r in range(rows):
+        ia = ao + r*ars
+        ib = bo + r*brs
+        if op == 'add':
+            for c in range(columns):
+                out[o] = a[ia] + b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'sub':
+            for c in range(columns):
+                out[o] = a[ia] - b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'mul':
+            for c in range(columns):
+                out[o] = a[ia] * b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'div':
+            for c in range(columns):
+                out[o] = a[ia] / b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        else:
+            for c in range(columns):
+                out[o] = a[ia] ** b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+    return out
+
+
+# Purpose: to gather a strided matrix of 2 byte entries ('h') into row major
+# order, copying raw words
+# Parameters: as for matrix_v3.copy_strided
+# returns: none
+@micropython.viper
+def copy_strided16(arr: ptr16, ao: int, ars: int, acs: int, rows: int,
+                   columns: int, out: ptr16):
+    o = 0
+    for r in range(rows):
+        i = ao + r*ars
+        for c in range(columns):
+            out[o] = arr[i]
+            o += 1
+            i += acs
+
+
+# Purpose: to gather a strided matrix of 4 byte entries ('i' or 'f') into
+# row major order, copying raw words
+# Parameters: as for matrix_v3.copy_strided
+# returns: none
+@micropython.viper
+def copy_strided32(arr: ptr32, ao: int, ars: int, acs: int, rows: int,
+                   columns: int, out: ptr32):
+    o = 0
+    for r in range(rows):
+        i = ao + r*ars
+        for c in range(columns):
+            out[o] = arr[i]
+            o += 1
+            i += acs
+
+
+# Purpose: to gather a strided matrix of 8 byte entries ('d') into row
+# major order, copying each entry as two raw words
+# Parameters: as for matrix_v3.copy_strided
+# returns: none
+@micropython.viper
+def copy_strided64(arr: ptr32, ao: int, ars: int, acs: int, rows: int,
+                   columns: int, out: ptr32):
+    o = 0
+    for r in range(rows):
+        i = (ao + r*ars) * 2
+        for c in range(columns):
+            out[o] = arr[i]
+            out[o + 1] = arr[i + 1]
+            o += 2
+            i += acs * 2
+
+
+# Purpose: to add two strided 'i' matrices as machine words. Like C, a sum
+# past the range of an int32 wraps around instead of raising
+# Parameters: as for matrix_v3.elementwise_kernel, without op
+# returns: none
+@micropython.viper
+def add_int32(a: ptr32, ao: int, ars: int, acs: int, b: ptr32, bo: int,
+              brs: int, bcs: int, out: ptr32, rows: int, columns: int):
+    o = 0
+    for r in range(rows):
+        ia = ao + r*ars
+        ib = bo + r*brs
+        for c in range(columns):
+            out[o] = a[ia] + b[ib]
+            o += 1
+            ia += acs
+            ib += bcs
+
+
+# Purpose: to subtract two strided 'i' matrices as machine words, wrapping
+# around like add_int32
+# Parameters: as for matrix_v3.elementwise_kernel, without op
+# returns: none
+@micropython.viper
+def sub_int32(a: ptr32, ao: int, ars: int, acs: int, b: ptr32, bo: int,
+              brs: int, bcs: int, out: ptr32, rows: int, columns: int):
+    o = 0
+    for r in range(rows):
+        ia = ao + r*ars
+        ib = bo + r*brs
+        for c in range(columns):
+            out[o] = a[ia] - b[ib]
+            o += 1
+            ia += acs
+            ib += bcs
+
+
+# Purpose: to multiply two strided 'i' matrices entry by entry as machine
+# words, wrapping around like add_int32
+# Parameters: as for matrix_v3.elementwise_kernel, without op
+# returns: none
+@micropython.viper
+def mul_int32(a: ptr32, ao: int, ars: int, acs: int, b: ptr32, bo: int,
+              brs: int, bcs: int, out: ptr32, rows: int, columns: int):
+    o = 0
+    for r in range(rows):
+        ia = ao + r*ars
+        ib = bo + r*brs
+        for c in range(columns):
+            out[o] = a[ia] * b[ib]
+            o += 1
+            ia += acs
+            ib += bcs
+
+
+# The viper copies by the type code of the arrays they copy
+TYPED_COPY = {'h': copy_strided16, 'i': copy_strided32,
+              'f': copy_strided32, 'd': copy_strided64}
+# The viper arithmetic by (op, type code), for operands and a result that
+# all share the type code
+TYPED_ELEMENTWISE = {('add', 'i'): add_int32, ('sub', 'i'): sub_int32,
+                     ('mul', 'i'): mul_int32}
@@ -0,0 +1,235 @@
+# Opt in profiling for matrix_v3.
+#
+#   with matrix_profile.Profile() as p:
+#       m1eq = matrix_v3.lin_regression(xs, ys)
+#   p.report()
+#
+# While a Profile is running, the Matrix methods, factorization methods and
+# regression stages are swapped for wrappers. The wrappers count calls,
+# cumulative time, estimated flops and matrix elements allocated, which
+# leaves out views and out buffers that were reused rather than replaced. The
+# originals are put back when it stops, so profiling costs nothing while it
+# is off. Times include nested calls, e.g. lin_regression includes gram.
+# Works on CPython and on MicroPython, where only time.ticks_us exists.
+import matrix_v3 as matrix
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+# Purpose: to count the entries of a matrix like result
+# Parameters: m which is a Matrix, LU, Cholesky or anything else
+# returns: the number of entries in its array, 0 if it has none
+def elements(m):
+    if isinstance(m, tuple) and m:
+        m = m[0]
+    arr = getattr(m, 'arr', None)
+    if arr is None:
+        return 0
+    return len(arr)
+
+
+# Purpose: to find the arrays held by the arguments of a call
+# Parameters: args and kwargs which are the arguments
+# returns: a list of the arrays, which a view or a reused out buffer returned
+# by the call would share
+def argument_arrays(args, kwargs):
+    arrays = []
+    for a in args:
+        arr = getattr(a, 'arr', None)
+        if arr is not None:
+            arrays.append(arr)
+    for a in kwargs.values():
+        arr = getattr(a, 'arr', None)
+        if arr is not None:
+            arrays.append(arr)
+    return arrays
+
+
+# Purpose: to count the entries a call allocated
+# Parameters: result which is what it returned, or the instance for
+# __init__, and arrays which are the arrays its arguments held before it ran
+# returns: the entries of the result's array, 0 if that is one of arrays
+def allocated(result, arrays):
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    arr = getattr(result, 'arr', None)
+    for a in arrays:
+        if a is arr:
+            return 0
+    return elements(result)
+
+
+# Purpose: to estimate the flops of a matrix product
+# Parameters: args which are the arguments the method was called with and
+# result which is what it returned
+# returns: the estimated flop count
+def mul_flops(args, result):
+    a = args[0]
+    b = args[1]
+    if not isinstance(b, matrix.Matrix):
+        return elements(result)
+    return 2 * a.get_rows() * a.get_columns() * b.get_columns()
+
+
+# Purpose: to get the order of a square matrix argument
+# Parameters: args which are the arguments of a method of a square matrix
+# returns: the number of rows of the matrix
+def order(args):
+    return args[0].get_rows()
+
+
+# Estimated flops per call for the operations that do arithmetic. The
+# composite stages (the regressions) are left out so the flops aren't
+# counted twice, their time still shows up
+FLOPS = {
+    'Matrix.__add__': lambda args, result: elements(result),
+    'Matrix.__sub__': lambda args, result: elements(result),
+    'Matrix.multiply': lambda args, result: elements(result),
+    'Matrix.__truediv__': lambda args, result: elements(result),
+    'Matrix.__mul__': mul_flops,
+    'Matrix.gram': lambda args, result:
+        args[0].get_rows() * args[0].get_columns() * (args[0].get_columns() + 1),
+    'Matrix.tmul': lambda args, result:
+        2 * args[0].get_rows() * elements(result),
+    'Matrix.polynomialize': lambda args, result: elements(result),
+    'PolynomialFeatures.transform': lambda args, result: elements(result),
+    'Matrix.determinant': lambda args, result: 2 * order(args) ** 3 // 3,
+    'Matrix.get_inverse': lambda args, result: 2 * order(args) ** 3,
+    'Matrix.cholesky': lambda args, result: order(args) ** 3 // 3,
+    'Matrix.dot_vec': lambda args, result: 2 * args[0].get_rows(),
+    'Matrix.predict_into': lambda args, result: 2 * elements(args[0]),
+    'LU.__init__': lambda args, result: 2 * args[1].get_rows() ** 3 // 3,
+    'LU.solve': lambda args, result: 2 * args[0].n ** 2,
+    'LU.solve_many': lambda args, result: 2 * args[0].n * elements(result),
+    'LU.inverse': lambda args, result: 2 * args[0].n ** 3,
+    'Cholesky.solve': lambda args, result: 2 * args[0].n ** 2,
+    'Cholesky.solve_many': lambda args, result: 2 * args[0].n * elements(result),
+    'GivensQR.rotate_in': lambda args, result:
+        6 * args[0].columns * (args[0].columns + args[0].outputs),
+    'GivensQR.solve': lambda args, result: args[0].columns ** 2 * args[0].outputs,
+    'RLS.update': lambda args, result: 4 * args[0].p ** 2,
+    'RLS.predict': lambda args, result: 2 * args[0].p,
+}
+
+# The methods wrapped on each class and the module level stages
+METHODS = {
+    'Matrix': ('__init__', 'T', 'clone', 'get', 'add_bias_ones',
+               'polynomialize', 'weights', '__add__', '__sub__', 'multiply',
+               '__truediv__', 'power', 'clip', 'map', '__mul__', 'gram',
+               'tmul', 'dot_vec', 'predict_into', 'determinant', 'factorize',
+               'cholesky', 'solve_spd', 'get_inverse'),
+    'LU': ('__init__', 'solve', 'solve_many', 'determinant', 'inverse'),
+    'Cholesky': ('solve', 'solve_many', 'determinant'),
+    'Scaler': ('partial_fit', 'transform'),
+    'PolynomialFeatures': ('transform', 'transform_row', 'predict', 'fold'),
+    'GivensQR': ('rotate_in', 'add_rows', 'solve'),
+    'OnlineRegression': ('add_sample', 'coefficients'),
+    'RLS': ('update', 'predict'),
+}
+STAGES = ('get_alpha', 'solve_normal', 'lstsq', 'fit_features',
+          'lin_regression', 'poly_regression')
+
+
+class Profile:
+    # Collects per operation statistics while it is running. Use it as a
+    # context manager or call start() and stop() around the code to profile
+    def __init__(self):
+        # name -> [calls, microseconds, flops, elements allocated]
+        self.stats = {}
+        self.saved = []
+
+    # Purpose: to make the wrapper that records one operation
+    # Parameters: self which is the Profile class, name which is the key to
+    # record under and fn which is the original function
+    # returns: the wrapper
+    def wrap(self, name, fn):
+        stats = self.stats
+        flops = FLOPS.get(name)
+        if name not in stats:
+            stats[name] = [0, 0, 0, 0]
+        entry = stats[name]
+        init = name.endswith('.__init__')
+
+        def wrapper(*args, **kwargs):
+            arrays = argument_arrays(args, kwargs)
+            start = ticks_us()
+            result = fn(*args, **kwargs)
+            entry[1] += ticks_diff(ticks_us(), start)
+            entry[0] += 1
+            if flops is not None:
+                entry[2] += flops(args, result)
+            entry[3] += allocated(args[0] if init else result, arrays)
+            return result
+        return wrapper
+
+    # Purpose: to install the wrappers
+    # Parameters: self which is the Profile class
+    # returns: self
+    def start(self):
+        for cls_name in METHODS:
+            cls = getattr(matrix, cls_name)
+            for method in METHODS[cls_name]:
+                original = getattr(cls, method)
+                self.saved.append((cls, method, original))
+                setattr(cls, method, self.wrap(cls_name + '.' + method, original))
+        for stage in STAGES:
+            original = getattr(matrix, stage)
+            self.saved.append((matrix, stage, original))
+            setattr(matrix, stage, self.wrap(stage, original))
+        return self
+
+    # Purpose: to put the original functions back
+    # Parameters: self which is the Profile class
+    # returns: self
+    def stop(self):
+        while self.saved:
+            owner, name, original = self.saved.pop()
+            setattr(owner, name, original)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # Purpose: to clear the collected statistics
+    # Parameters: self which is the Profile class
+    # returns: none
+    def reset(self):
+        for name in self.stats:
+            entry = self.stats[name]
+            for i in range(4):
+                entry[i] = 0
+
+    # Purpose: to print a summary of the operations that were called, the
+    # most expensive first
+    # Parameters: self which is the Profile class and stream which is
+    # anything with a write method, stdout if not given
+    # returns: none
+    def report(self, stream=None):
+        names = [n for n in self.stats if self.stats[n][0]]
+        names.sort(key=lambda n: -self.stats[n][1])
+        lines = ['%-28s %8s %12s %10s %12s %8s %10s' % (
+            'operation', 'calls', 'total us', 'mean us', 'flops',
+            'MFLOP/s', 'elements')]
+        for n in names:
+            calls, us, flops, allocated = self.stats[n]
+            rate = flops / us if us else 0
+            lines.append('%-28s %8d %12d %10.1f %12d %8.2f %10d' % (
+                n, calls, us, us / calls, flops, rate, allocated))
+        text = '\n'.join(lines) + '\n'
+        if stream is None:
+            print(text, end='')
+        else:
+            stream.write(text)
@@ -16,19 +16,51 @@ def get_matrix_minor(arr,i,j,n):
 
 
 
+# @micropython.native
+def lu_decompose(arr, n, piv=None):
+    "Packed in-place LU with partial pivoting. Returns the permutation sign"
+    sign = 1
+    for k in range(n):
+        p = k
+        big = abs(arr[k*n+k])
+        for i in range(k+1, n):
+            v = abs(arr[i*n+k])
+            if v > big:
+                big = v
+                p = i
+        if piv is not None:
+            piv[k] = p
+        if p != k:
+            kn = k*n
+            pn = p*n
+            for j in range(n):
+                t = arr[kn+j]
+                arr[kn+j] = arr[pn+j]
+                arr[pn+j] = t
+            sign = -sign
+        pivot = arr[k*n+k]
+        if pivot == 0:
+            continue
+        kn = k*n
+        for i in range(k+1, n):
+            ikn = i*n
+            f = arr[ikn+k] / pivot
+            arr[ikn+k] = f
+            if f != 0:
+                for j in range(k+1, n):
+                    arr[ikn+j] -= f * arr[kn+j]
+    return sign
+
 #@micropython.native
 def determinant_helper(arr, n):
-    #base case for 1x1 matrix
-    if n == 1:
-        return arr[0]
-    #base case for 2x2 matrix
-    #if n == 2:
-    #    return arr[0]*arr[3]-arr[2]*arr[1]
-    determinant = 0
-    for c in range(n):
-        a = ((-1)**c) * arr[c]
-        b = a * determinant_helper(get_matrix_minor(arr,0,c,n), n-1)
-        determinant += b
+    # product of the LU pivots, factored on a scratch copy of arr
+    if len(arr) != n*n:
+        raise ValueError('expected %d entries for a %dx%d matrix, got %d'
+                         % (n*n, n, n, len(arr)))
+    scratch = array('f', arr)
+    determinant = lu_decompose(scratch, n)
+    for k in range(n):
+        determinant *= scratch[k*n+k]
     return determinant
 
 
@@ -165,7 +197,7 @@ class Matrix:
     def add_bias_ones(self):
         out = Matrix()
         if self.transposed:
-            return #Fix this
+            return self.clone().add_bias_ones()
 
         for i in range(len(self.arr)):
             if i % self.columns == 0:
@@ -264,7 +296,6 @@ class Matrix:
 # print(c.get_inverse())
 #
 #
-x = Matrix([67.77472353218393, 88.13098577413399, 42.52930638931034, 37.5432806277281, 1.9198458039374589, 95.64210152543843, 26.949504997381247, 4.009564303303248, 8.80509597940209, 39.79363879960982, 35.22092471535084, 39.587780219127154, 45.51274216523215, 54.12805293908667, 47.18181666996103, 93.02835319332387, 31.13950562616774, 59.7201510037116, 53.80654305953264, 28.287518357163055, 60.907829142815714, 55.76053745287567, 85.95283416834502, 90.59405475757596, 9.171543655741898, 23.025560679907777, 60.99942588993682, 37.49909274641523, 12.382262103698116, 48.1340567049508, 59.810056065284186, 55.69024159681184, 26.472862346215685, 55.64166467054768, 98.25844497890856, 67.45911742045018, 35.70496846044291, 34.53169412582007, 84.34463972723368, 61.613497631901915, 66.50117081869747, 53.66378204285315, 52.51150387842664, 75.24835517166078, 58.08863674988469, 17.82671979420205, 74.87713609834073, 32.001925460763466, 3.2125461538568656, 19.334962956074985, 49.847395753673204, 1.191178612719479, 9.880892601113356, 95.52218273763998, 27.807248036544173, 16.102315812701406, 5.777375785533733, 9.44901880427782, 6.017851911013605, 49.081003991780825, 22.471509132751898, 51.54633680998347, 7.225774728437839, 14.605177598825103, 90.07781382345678, 74.90636996433466, 1.7946030180889916, 46.15424242576249, 12.845219231094863, 11.914080644846049, 90.08027263782967, 22.493566306822455, 53.5641400860013, 97.63601172202887, 32.78747204720162, 69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128, 19.801177481341924, 16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224, 24.657078293121803, 44.62451863254328, 46.36020966840929, 42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871, 23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609])
 # # y = Matrix([474.4230647252875, 616.916900418938, 297.7051447251724, 262.8029643940967, 13.438920627562212, 669.494710678069, 188.64653498166874, 28.066950123122737, 61.63567185581463, 278.55547159726876, 246.5464730074559, 277.1144615338901, 318.589195156625, 378.8963705736067, 330.2727166897272, 651.1984723532671, 217.97653938317418, 418.0410570259812, 376.6458014167285, 198.01262850014137, 426.35480399971, 390.32376217012967, 601.6698391784151, 634.1583833030318, 64.20080559019328, 161.17892475935443, 426.99598122955774, 262.4936492249066, 86.67583472588682, 336.9383969346556, 418.6703924569893, 389.83169117768284, 185.31003642350979, 389.4916526938337, 687.8091148523599, 472.2138219431513, 249.9347792231004, 241.72185888074046, 590.4124780906358, 431.2944834233134, 465.50819573088233, 375.64647429997206, 367.58052714898645, 526.7384862016254, 406.62045724919284, 124.78703855941434, 524.139952688385, 224.01347822534427, 22.48782307699806, 135.3447406925249, 348.93177027571244, 8.338250289036353, 69.16624820779349, 668.6552791634799, 194.65073625580922, 112.71621068890984, 40.44163049873613, 66.14313162994475, 42.124963377095234, 343.56702794246576, 157.3005639292633, 360.8243576698843, 50.58042309906487, 102.23624319177571, 630.5446967641974, 524.3445897503426, 12.56222112662294, 323.0796969803374, 89.91653461766404, 83.39856451392234, 630.5619084648076, 157.45496414775718, 374.9489806020091, 683.452082054202, 229.51230433041133, 487.84818353041544, 598.162535205567, 81.64753715044067, 624.9347294404989, 138.60824236939345, 117.53559349957258, 309.6740531269315, 186.41635618347956, 569.1321739462012, 52.033353434055336, 492.6110553682465, 497.4530669948857, 172.59954805185262, 312.3716304278029, 324.521467678865, 298.6465266628083, 509.97772479448304, 636.9372867899799, 253.69288578456977, 94.9068859051381, 164.49447147680414, 251.06638920175888, 383.0397669874144, 600.0299637338092, 412.3447111827126])
 #
 # # @micropython.native
@@ -292,7 +323,10 @@ x = Matrix([67.77472353218393, 88.13098577413399, 42.52930638931034, 37.54328062
 # # print(lin_regression(x, y))
 
 
-st = datetime.datetime.now()
-out = inverse_helper(x.arr, 10)
-et = datetime.datetime.now()
-print(et - st)
+if __name__ == '__main__':
+    x = Matrix([67.77472353218393, 88.13098577413399, 42.52930638931034, 37.5432806277281, 1.9198458039374589, 95.64210152543843, 26.949504997381247, 4.009564303303248, 8.80509597940209, 39.79363879960982, 35.22092471535084, 39.587780219127154, 45.51274216523215, 54.12805293908667, 47.18181666996103, 93.02835319332387, 31.13950562616774, 59.7201510037116, 53.80654305953264, 28.287518357163055, 60.907829142815714, 55.76053745287567, 85.95283416834502, 90.59405475757596, 9.171543655741898, 23.025560679907777, 60.99942588993682, 37.49909274641523, 12.382262103698116, 48.1340567049508, 59.810056065284186, 55.69024159681184, 26.472862346215685, 55.64166467054768, 98.25844497890856, 67.45911742045018, 35.70496846044291, 34.53169412582007, 84.34463972723368, 61.613497631901915, 66.50117081869747, 53.66378204285315, 52.51150387842664, 75.24835517166078, 58.08863674988469, 17.82671979420205, 74.87713609834073, 32.001925460763466, 3.2125461538568656, 19.334962956074985, 49.847395753673204, 1.191178612719479, 9.880892601113356, 95.52218273763998, 27.807248036544173, 16.102315812701406, 5.777375785533733, 9.44901880427782, 6.017851911013605, 49.081003991780825, 22.471509132751898, 51.54633680998347, 7.225774728437839, 14.605177598825103, 90.07781382345678, 74.90636996433466, 1.7946030180889916, 46.15424242576249, 12.845219231094863, 11.914080644846049, 90.08027263782967, 22.493566306822455, 53.5641400860013, 97.63601172202887, 32.78747204720162, 69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128, 19.801177481341924, 16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224, 24.657078293121803, 44.62451863254328, 46.36020966840929, 42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871, 23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609])
+
+    st = datetime.datetime.now()
+    out = inverse_helper(x.arr, 10)
+    et = datetime.datetime.now()
+    print(et - st)
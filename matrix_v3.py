@@ -1,105 +1,816 @@
 from array import array
 from cmath import e , log
 from math import sqrt
+import struct
 
-# @micropython.native
+# CPython's operator.mul lets a dot product run as sum(map(mul, row, column))
+# inside the interpreter's C loops. MicroPython usually has no operator
+# module and the kernels fall back to their index loops there
+try:
+    from operator import mul
+except ImportError:
+    mul = None
 
+# NumPy is only there on a host, never on the hub. When it is, it becomes the
+# backend: products and elementwise operations are handed to it, running on
+# ndarray views of the same array buffers, so a Matrix behaves the same and
+# holds the same data under either backend. The factorizations are p by p
+# and stay in Python
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# On the hub matrix_native holds the kernels below compiled to machine code
+# with @micropython.native and @micropython.viper. It only imports under
+# MicroPython, everywhere else the pure Python kernels here are used. A
+# native .mpy built for another architecture raises ValueError and firmware
+# without the native emitters raises SyntaxError, and those fall back too
+try:
+    import matrix_native
+except (ImportError, ValueError, SyntaxError):
+    matrix_native = None
+
+BACKENDS = ('python', 'numpy')
+BACKEND = 'python' if numpy is None else 'numpy'
+# operations touching fewer entries than this stay in Python, where they are
+# cheaper than the call into NumPy
+NUMPY_MIN_SIZE = 128
+if numpy is not None:
+    NUMPY_TYPES = {'h': numpy.int16, 'i': numpy.int32, 'f': numpy.float32,
+                   'd': numpy.float64}
+    # NumPy works in these and rounds into the result's type, like the
+    # Python kernels do with Python floats and ints
+    NUMPY_WORK_TYPES = {'h': numpy.int64, 'i': numpy.int64,
+                        'f': numpy.float64, 'd': numpy.float64}
+    NUMPY_OPS = {'add': numpy.add, 'sub': numpy.subtract,
+                 'mul': numpy.multiply, 'div': numpy.true_divide,
+                 'pow': numpy.power}
+
+# Matrix.save writes this header before the entries: the magic, the format
+# version, the type code, flags, a pad byte, then the rows and the columns.
+# The entries follow in the byte order of the machine that saved them, which
+# is little endian on the hub and on any common host
+HEADER = '<4sBBBBII'
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = b'UMTX'
+FORMAT_VERSION = 1
+# set when the entries are stored column by column
+TRANSPOSED = 1
+
+
+# Purpose: to choose which kernels the Matrix operations run on
+# Parameters: name which is 'numpy' or 'python'
+# returns: the backend that was in use before
+def set_backend(name):
+    global BACKEND
+    if name not in BACKENDS:
+        raise ValueError("backend should be 'python' or 'numpy'")
+    if name == 'numpy' and numpy is None:
+        raise ImportError('numpy is not installed')
+    previous = BACKEND
+    BACKEND = name
+    return previous
+
+
+# Purpose: to find which kernels the Matrix operations run on
+# Parameters: none
+# returns: 'numpy' or 'python'
+def get_backend():
+    return BACKEND
+
+
+# Purpose: to decide whether an operation goes to NumPy
+# Parameters: size which is the number of entries or multiply-adds the
+# operation works through
+# returns: True if the NumPy backend is in use and the operation is big
+# enough to be worth it
+def use_numpy(size):
+    return BACKEND == 'numpy' and size >= NUMPY_MIN_SIZE
 
-# Purpose: this function is used as a helper function in order to attain the
-# smaller matrices used in finding the determinant of the main matrix
-# Parameters: this takes in an array that represents a matrix, the i'th and
-# j'th parameter are the matrix indeces in which the matrix minor will be
-# centered
-# returns: this returns the smaller matrix that will be used in the calculation
-# of the determinant
-#
-# edge case not addressed if it is a 1 by 1 matrix it will be less than length
-# 1 but continue and not print a[0]
-def get_matrix_minor(arr,i,j,n):
-    a = [arr[n*x:n*x + j] + arr[n*x+j+1:n*x+n] for x in range(n) if x != i]
-    if len(a) < 1:
-        print(arr, n, a)
-    out = a[0]
-    for i in range(1, len(a)):
-        out = out + a[i]
-    return out
 
+# Bytes per entry of each array type code a matrix can be stored in. 'f' is
+# the default, 'd' doubles the precision and the memory for fits that need
+# it, 'i' and 'h' hold raw integer sensor counts, 'h' at half the size of 'f'
+ITEMSIZE = {'h': 2, 'i': 4, 'f': 4, 'd': 8}
+# The type codes in promotion order. Adding or multiplying two matrices gives
+# the later of their two type codes, and a product of integer matrices is at
+# least 'i' since its sums would overflow 'h'
+PROMOTION = 'hifd'
+
+
+# Purpose: to allocate a zeroed array in one go
+# Parameters: type_code of the array and n which is its number of entries
+# returns: the array
+def zeros_array(type_code, n):
+    return array(type_code, bytes(ITEMSIZE[type_code] * n))
+
+
+# Purpose: to find the type code of the result of combining two matrices
+# Parameters: a and b which are type codes
+# returns: whichever of a and b comes later in PROMOTION
+def promote(a, b):
+    if PROMOTION.index(a) >= PROMOTION.index(b):
+        return a
+    return b
+
+
+# Purpose: to find the type code to factor, solve or invert in. Integer
+# matrices are solved in 'f' since their results are fractions
+# Parameters: type_code of the matrix
+# returns: 'd' for 'd' and 'f' for everything else
+def float_type(type_code):
+    if type_code == 'd':
+        return 'd'
+    return 'f'
+
+
+# Purpose: to turn one index of a matrix subscript into the entries it picks
+# Parameters: index which is an int or a slice and n which is the length of
+# the dimension it indexes
+# returns: the first entry, the number of entries and the step between them
+def slice_bounds(index, n):
+    if isinstance(index, int):
+        if index < 0:
+            index += n
+        if index < 0 or index >= n:
+            raise IndexError('matrix index out of range')
+        return index, 1, 1
+    step = 1 if index.step is None else index.step
+    if step <= 0:
+        raise ValueError('matrix slices need a positive step')
+    start = 0 if index.start is None else index.start
+    stop = n if index.stop is None else index.stop
+    if start < 0:
+        start = max(start + n, 0)
+    if stop < 0:
+        stop += n
+    start = min(start, n)
+    stop = min(stop, n)
+    if stop <= start:
+        return start, 0, step
+    return start, (stop - start + step - 1) // step, step
+
+
+# @micropython.native
+# Purpose: to factor a square matrix into its lower and upper triangular parts
+# in place using Gaussian elimination with partial pivoting. The multipliers
+# of L (whose diagonal is all ones) are stored below the diagonal and U is
+# stored on and above it
+# Parameters: arr is a flat array holding the n by n matrix, it will be
+# overwritten with the packed factors. piv is an optional array of length n
+# that receives the row swapped into place at each step
+# returns: the sign of the row permutation (1 or -1)
+def lu_decompose(arr, n, piv=None):
+    sign = 1
+    for k in range(n):
+        # find the largest entry in column k on or below the diagonal
+        p = k
+        big = abs(arr[k*n+k])
+        for i in range(k+1, n):
+            v = abs(arr[i*n+k])
+            if v > big:
+                big = v
+                p = i
+        if piv is not None:
+            piv[k] = p
+        if p != k:
+            kn = k*n
+            pn = p*n
+            for j in range(n):
+                t = arr[kn+j]
+                arr[kn+j] = arr[pn+j]
+                arr[pn+j] = t
+            sign = -sign
+        pivot = arr[k*n+k]
+        if pivot == 0:
+            # singular column, nothing left to eliminate
+            continue
+        kn = k*n
+        for i in range(k+1, n):
+            ikn = i*n
+            f = arr[ikn+k] / pivot
+            arr[ikn+k] = f
+            if f != 0:
+                for j in range(k+1, n):
+                    arr[ikn+j] -= f * arr[kn+j]
+    return sign
 
-#@micropython.native
+
+# @micropython.native
 # Purpose: to find the determinant of a matrix
 # Parameters: the array which a determinant is being calculated for and the
 # n by n dimensions since it must be the same in order for a determinant
-# to exist
-# returns: the determinant of the matrix
-def determinant_helper(arr, n):
-    if n == 1:
-        return arr[0]
-    determinant = 0
-    for c in range(n):
-        a = ((-1)**c) * arr[c]
-        b = a * determinant_helper(get_matrix_minor(arr,0,c,n), n-1)
-        determinant += b
+# to exist, and the type code of the scratch copy the factorization runs on
+# returns: the determinant of the matrix, the product of the pivots of its LU
+# factorization. The factorization runs on a scratch copy so arr is untouched
+def determinant_helper(arr, n, type_code='f'):
+    scratch = array(type_code, arr)
+    determinant = lu_decompose(scratch, n)
+    for k in range(n):
+        determinant *= scratch[k*n+k]
     return determinant
 
 
 # @micropython.native
-# Purpose: to tranpose any given matrix
-# Parameters: the array containing the matrix, the ammount of rows and columns
-# in the matrix as well as an empty array that will be populated by the
-# transposed matrix
-# returns: the transposed matrix
-def transpose_matrix(arr, rows, columns, out):
-    for c in range(columns):
+# Purpose: to solve a system using packed LU factors, forward substituting
+# through L and then back substituting through U
+# Parameters: lu is the flat array produced by lu_decompose with the n pivot
+# rows stored after the n*n factors, x holds the right hand side and is
+# overwritten with the solution. offset and stride locate the vector inside
+# x so a single column of a row-major matrix can be solved in place
+# returns: x
+def lu_solve(lu, n, x, offset=0, stride=1):
+    nn = n*n
+    for k in range(n):
+        p = int(lu[nn+k])
+        if p != k:
+            t = x[offset+k*stride]
+            x[offset+k*stride] = x[offset+p*stride]
+            x[offset+p*stride] = t
+    for i in range(n):
+        s = x[offset+i*stride]
+        for j in range(i):
+            s -= lu[i*n+j] * x[offset+j*stride]
+        x[offset+i*stride] = s
+    for i in range(n-1, -1, -1):
+        s = x[offset+i*stride]
+        for j in range(i+1, n):
+            s -= lu[i*n+j] * x[offset+j*stride]
+        x[offset+i*stride] = s / lu[i*n+i]
+    return x
+
+
+# @micropython.native
+# Purpose: to factor a symmetric positive definite matrix as L * L^T. Only
+# the lower triangle of arr is read and L is stored packed by rows, so entry
+# (i, j) with j <= i lives at i*(i+1)//2 + j
+# Parameters: arr is the flat n by n matrix, out is an array of n*(n+1)//2
+# entries that receives L
+# returns: True, or False if a pivot is not positive, meaning the matrix is
+# not positive definite
+def cholesky_decompose(arr, n, out):
+    for i in range(n):
+        ii = i*(i+1)//2
+        for j in range(i+1):
+            jj = j*(j+1)//2
+            s = arr[i*n+j]
+            for k in range(j):
+                s -= out[ii+k] * out[jj+k]
+            if i == j:
+                if s <= 0:
+                    return False
+                out[ii+i] = sqrt(s)
+            else:
+                out[ii+j] = s / out[jj+j]
+    return True
+
+
+# @micropython.native
+# Purpose: to solve L * L^T x = b with a packed Cholesky factor, forward
+# substituting through L and back substituting through L^T
+# Parameters: L is the packed factor from cholesky_decompose, x holds the
+# right hand side and is overwritten with the solution. offset and stride
+# locate the vector inside x as in lu_solve
+# returns: x
+def cholesky_solve(L, n, x, offset=0, stride=1):
+    for i in range(n):
+        ii = i*(i+1)//2
+        s = x[offset+i*stride]
+        for k in range(i):
+            s -= L[ii+k] * x[offset+k*stride]
+        x[offset+i*stride] = s / L[ii+i]
+    for i in range(n-1, -1, -1):
+        s = x[offset+i*stride]
+        for k in range(i+1, n):
+            s -= L[k*(k+1)//2+i] * x[offset+k*stride]
+        x[offset+i*stride] = s / L[i*(i+1)//2+i]
+    return x
+
+
+# Purpose: to find where the entries of a matrix live in its array, so
+# kernels can walk the array directly instead of calling get for every entry
+# Parameters: m which is a matrix, possibly a transposed view or a block
+# returns: the offset, row stride and column stride such that entry (r, c)
+# is arr[offset + r*row_stride + c*column_stride]
+def get_strides(m):
+    return m.offset, m.rstride, m.cstride
+
+
+# Purpose: to get the matrix an operation writes its result into. A given
+# out keeps its buffer when the size already matches so repeated calls
+# allocate nothing, otherwise it is reallocated, as it is when it shares an
+# array the operation is still reading from
+# Parameters: out which is a matrix or None, rows, columns and type code of
+# the result and reads which are the arrays the operation reads while it
+# writes. An out of another type code is reallocated too
+# returns: out, or a new matrix, shaped rows by columns and contiguous
+def prepare_out(out, rows, columns, type_code, *reads):
+    if out is None:
+        out = Matrix(None, type_code)
+    n = rows * columns
+    realloc = len(out.arr) != n or out.type_code != type_code
+    for arr in reads:
+        if out.arr is arr:
+            realloc = True
+    if realloc:
+        out.arr = zeros_array(type_code, n)
+        out.version = [0]
+    out.type_code = type_code
+    out.offset = 0
+    out.rows = rows
+    out.columns = columns
+    out.rstride = columns
+    out.cstride = 1
+    out.changed()
+    return out
+
+
+# Purpose: to pick which rows or columns a printout shows
+# Parameters: n which is how many there are and limit which is the most to
+# show
+# returns: a list of the indices to show, with None where the ellipsis goes
+# when the first and last ones are shown instead of all n
+def shown_indices(n, limit):
+    if n <= limit:
+        return list(range(n))
+    head = (limit + 1) // 2
+    return list(range(head)) + [None] + list(range(n - limit // 2, n))
+
+
+# Purpose: to wrap an array the caller has filled in as a matrix
+# Parameters: arr which holds rows*columns entries in row major order, the
+# rows and columns of the matrix and the type code arr was made with
+# returns: a matrix using arr as its buffer
+def wrap_array(arr, rows, columns, type_code='f'):
+    out = Matrix(None, type_code)
+    out.arr = arr
+    out.version = [0]
+    out.rows = rows
+    out.columns = columns
+    out.rstride = columns
+    return out
+
+
+# @micropython.native
+# Purpose: to multiply two matrices given as strided arrays. Both operands'
+# strides are resolved by the caller once, so the inner loop is nothing but
+# array indexing, and the output is written row by row into a preallocated
+# array. Where slicing with a step works, each column of b is gathered into a
+# contiguous array once, rather than strided down again for every row of a,
+# and each entry is one sum(map(mul, row, column)). Matrix-vector and
+# vector-matrix products get their own loops
+# Parameters: a and b are the operand arrays each followed by its offset, row
+# stride and column stride, out is an array of rows*columns entries for the
+# row-major result, inner is the shared dimension
+# returns: out
+def matmul_kernel(a, ao, ars, acs, b, bo, brs, bcs, out, rows, inner, columns):
+    if mul is not None and inner:
+        alen = (inner-1)*acs + 1
+        blen = (inner-1)*brs + 1
+        if columns == 1:
+            col = b[bo:bo+blen:brs].tolist()
+            for r in range(rows):
+                ia = ao + r*ars
+                out[r] = sum(map(mul, a[ia:ia+alen:acs], col))
+            return out
+        cols = [b[ib:ib+blen:brs].tolist() for ib in range(bo, bo + columns*bcs, bcs)]
+        o = 0
         for r in range(rows):
-            out.append(arr[r * columns + c])
+            ia = ao + r*ars
+            row = a[ia:ia+alen:acs].tolist()
+            for col in cols:
+                out[o] = sum(map(mul, row, col))
+                o += 1
+        return out
+    if columns == 1:
+        for r in range(rows):
+            ia = ao + r*ars
+            ib = bo
+            s = 0
+            for i in range(ia, ia + inner*acs, acs):
+                s += a[i] * b[ib]
+                ib += brs
+            out[r] = s
+        return out
+    if rows == 1:
+        end = ao + inner*acs
+        for c in range(columns):
+            ib = bo + c*bcs
+            s = 0
+            for i in range(ao, end, acs):
+                s += a[i] * b[ib]
+                ib += brs
+            out[c] = s
+        return out
+    o = 0
+    for r in range(rows):
+        arow = ao + r*ars
+        end = arow + inner*acs
+        for c in range(columns):
+            ib = bo + c*bcs
+            s = 0
+            for i in range(arow, end, acs):
+                s += a[i] * b[ib]
+                ib += brs
+            out[o] = s
+            o += 1
     return out
 
 
 # @micropython.native
-# Purpose: to inverse of a given matrix
-# Parameters: the array which a determinant is being calculated for and the
-# n by n dimensions since it must be the same in order for a determinant
-# to exist
-# returns: the inverse of the matrix
-def inverse_helper(arr, n):
-    # determinant = determinant_helper(arr, n)
-    # if n == 1:
-    #     return [[1/determinant]]
-    # cofactors = array('f')
-    # cofactorRow = array('f')
-    # for r in range(n):
-    #     for c in range(n):
-    #         minor = get_matrix_minor(arr,r,c,n)
-    #         cofactorRow.append(((-1)**(r+c)) * determinant_helper(minor, n-1))
-    #     cofactors.extend(cofactorRow[-n:])
-    # cofactors = transpose_matrix(cofactors,n,n,array('f'))
-    # for c in range(len(cofactors)):
-    #        cofactors[c] = cofactors[c]/determinant
-    # return cofactors
-    copyarr = arr
-    Inv = identity(n)
-    for fd in range(n):
-        fdScaler = 1.0 / copyarr[fd*n+fd]
+# Purpose: to find the Gram matrix X^T X of a strided matrix without making
+# a transposed copy. The result is symmetric so only the upper triangle is
+# computed and then mirrored into the lower one
+# Parameters: a is the array holding X followed by its offset, row stride and
+# column stride, rows and columns are the dimensions of X, out is an array
+# of columns*columns entries for the result
+# returns: out
+def gram_kernel(a, ao, ars, acs, rows, columns, out):
+    if mul is not None and rows:
+        n = (rows-1)*ars + 1
+        cols = [a[ci:ci+n:ars].tolist() for ci in range(ao, ao + columns*acs, acs)]
+        for i in range(columns):
+            ci = cols[i]
+            for j in range(i, columns):
+                s = sum(map(mul, ci, cols[j]))
+                out[i*columns+j] = s
+                out[j*columns+i] = s
+        return out
+    for i in range(columns):
+        ci = ao + i*acs
+        for j in range(i, columns):
+            ib = ao + j*acs
+            s = 0
+            for ia in range(ci, ci + rows*ars, ars):
+                s += a[ia] * a[ib]
+                ib += ars
+            out[i*columns+j] = s
+            out[j*columns+i] = s
+    return out
+
+
+# @micropython.native
+# Purpose: to gather a strided matrix, such as a transposed view or a block,
+# into row major order
+# Parameters: the array containing the matrix followed by its offset, row
+# stride and column stride, the ammount of rows and columns in the matrix as
+# well as an array of rows*columns entries that will be overwritten
+# returns: out
+def copy_strided(arr, ao, ars, acs, rows, columns, out):
+    o = 0
+    for r in range(rows):
+        i = ao + r*ars
+        for c in range(columns):
+            out[o] = arr[i]
+            o += 1
+            i += acs
+    return out
+
+
+# @micropython.native
+# Purpose: to apply one arithmetic operator entry by entry to two strided
+# operands. A stride of 0 repeats an entry, which is how a row or column
+# vector, or a scalar, is broadcast across the result
+# Parameters: op which is one of 'add', 'sub', 'mul', 'div' or 'pow', a and
+# b are the operand arrays (or one entry lists for scalars) each followed by
+# its offset, row stride and column stride, out is an array of rows*columns
+# entries for the row major result
+# returns: out
+def elementwise_kernel(op, a, ao, ars, acs, b, bo, brs, bcs, out, rows, columns):
+    # operands whose rows follow on from each other are walked as one run
+    if ars == columns*acs and brs == columns*bcs:
+        columns *= rows
+        rows = 1
+    o = 0
+    for r in range(rows):
+        ia = ao + r*ars
+        ib = bo + r*brs
+        if op == 'add':
+            for c in range(columns):
+                out[o] = a[ia] + b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'sub':
+            for c in range(columns):
+                out[o] = a[ia] - b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'mul':
+            for c in range(columns):
+                out[o] = a[ia] * b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        elif op == 'div':
+            for c in range(columns):
+                out[o] = a[ia] / b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+        else:
+            for c in range(columns):
+                out[o] = a[ia] ** b[ib]
+                o += 1
+                ia += acs
+                ib += bcs
+    return out
+
+
+# The pure Python kernels, kept under their names so benchmark.py can time
+# the compiled ones against them
+PYTHON_KERNELS = {
+    'lu_decompose': lu_decompose,
+    'lu_solve': lu_solve,
+    'cholesky_decompose': cholesky_decompose,
+    'cholesky_solve': cholesky_solve,
+    'matmul_kernel': matmul_kernel,
+    'gram_kernel': gram_kernel,
+    'copy_strided': copy_strided,
+    'elementwise_kernel': elementwise_kernel,
+}
+# viper kernels for arrays of one type code, the copies keyed by type code
+# and the arithmetic by (op, type code). Empty without matrix_native
+TYPED_COPY = {}
+TYPED_ELEMENTWISE = {}
+if matrix_native is not None:
+    lu_decompose = matrix_native.lu_decompose
+    lu_solve = matrix_native.lu_solve
+    cholesky_decompose = matrix_native.cholesky_decompose
+    cholesky_solve = matrix_native.cholesky_solve
+    matmul_kernel = matrix_native.matmul_kernel
+    gram_kernel = matrix_native.gram_kernel
+    copy_strided = matrix_native.copy_strided
+    elementwise_kernel = matrix_native.elementwise_kernel
+    TYPED_COPY = matrix_native.TYPED_COPY
+    TYPED_ELEMENTWISE = matrix_native.TYPED_ELEMENTWISE
+
+
+# Purpose: to line an operand up with the shape of an elementwise result
+# Parameters: m which is a matrix or a number, and the rows and columns of
+# the result
+# returns: the array to read m from, its offset, row stride and column
+# stride. A dimension of 1 is broadcast with a stride of 0
+def broadcast_strides(m, rows, columns):
+    if not isinstance(m, Matrix):
+        return [m], 0, 0, 0
+    mo, mrs, mcs = get_strides(m)
+    if m.rows != rows:
+        if m.rows != 1:
+            raise ValueError('matrix shapes can not be broadcast together')
+        mrs = 0
+    if m.columns != columns:
+        if m.columns != 1:
+            raise ValueError('matrix shapes can not be broadcast together')
+        mcs = 0
+    return m.arr, mo, mrs, mcs
+
+
+# Purpose: to find the type code of an elementwise result
+# Parameters: op as for elementwise_kernel, a and b which are matrices or
+# numbers
+# returns: the promotion of the operands' type codes, where an int counts
+# as no type and a float as 'f'. Division and powers are always floats and
+# products are at least 'i', like matrix products, since the product of
+# two 'h' entries soon overflows 'h'
+def elementwise_type(op, a, b):
+    type_code = 'h'
+    for m in (a, b):
+        if isinstance(m, Matrix):
+            type_code = promote(type_code, m.type_code)
+        elif isinstance(m, float):
+            type_code = promote(type_code, 'f')
+    if op == 'div' or op == 'pow':
+        return float_type(type_code)
+    if op == 'mul':
+        return promote(type_code, 'i')
+    return type_code
+
+
+# Purpose: to apply an arithmetic operator entry by entry, broadcasting a
+# 1 by c row, an r by 1 column or a number across the other operand. Large
+# operations go to NumPy when it can be imported
+# Parameters: op as for elementwise_kernel, a and b which are matrices or
+# numbers, at least one a matrix, and out which is an optional matrix whose
+# buffer receives the result
+# returns: the result matrix
+def elementwise(op, a, b, out=None):
+    rows = 1
+    columns = 1
+    for m in (a, b):
+        if isinstance(m, Matrix):
+            rows = max(rows, m.rows)
+            columns = max(columns, m.columns)
+    aa, ao, ars, acs = broadcast_strides(a, rows, columns)
+    ba, bo, brs, bcs = broadcast_strides(b, rows, columns)
+    # an operand read in any other order than the result is written in
+    # can't share the result's buffer
+    reads = []
+    if ars != columns*acs or acs != 1 or ao != 0:
+        reads.append(aa)
+    if brs != columns*bcs or bcs != 1 or bo != 0:
+        reads.append(ba)
+    if use_numpy(rows*columns):
+        # views are taken first since out may be one of the operands
+        av = ndarray_view(a) if isinstance(a, Matrix) else a
+        bv = ndarray_view(b) if isinstance(b, Matrix) else b
+        type_code = elementwise_type(op, a, b)
+        # the errors Python arithmetic raises where NumPy gives inf or nan
+        if op == 'div' and numpy.any(bv == 0):
+            raise ZeroDivisionError('division by zero')
+        if op == 'pow':
+            if numpy.any((av == 0) & (bv < 0)):
+                raise ZeroDivisionError('zero to a negative power')
+            if numpy.any((av < 0) & (bv != numpy.floor(bv))):
+                raise TypeError('a negative number to a fractional power '
+                                'is complex')
+        result = NUMPY_OPS[op](av, bv, dtype=NUMPY_WORK_TYPES[type_code])
+        out = prepare_out(out, rows, columns, type_code, *reads)
+        return numpy_store(result, out)
+    out = prepare_out(out, rows, columns, elementwise_type(op, a, b), *reads)
+    kernel = None
+    if (isinstance(a, Matrix) and isinstance(b, Matrix)
+            and a.type_code == out.type_code and b.type_code == out.type_code):
+        kernel = TYPED_ELEMENTWISE.get((op, out.type_code))
+    if kernel is None:
+        elementwise_kernel(op, aa, ao, ars, acs, ba, bo, brs, bcs, out.arr,
+                           rows, columns)
+    else:
+        kernel(aa, ao, ars, acs, ba, bo, brs, bcs, out.arr, rows, columns)
+    return out
+
+
+# Purpose: to see a matrix as a NumPy array over the same memory, so NumPy
+# reads and writes the array('f') buffer in place
+# Parameters: m which is a matrix
+# returns: an ndarray of m's shape sharing m's array
+def ndarray_view(m):
+    size = ITEMSIZE[m.type_code]
+    flat = numpy.frombuffer(m.arr, dtype=NUMPY_TYPES[m.type_code])
+    return numpy.lib.stride_tricks.as_strided(
+        flat[m.offset:], shape=(m.rows, m.columns),
+        strides=(m.rstride * size, m.cstride * size))
+
+
+# Purpose: to write a result NumPy worked out in NUMPY_WORK_TYPES into a
+# matrix, failing where storing it into an array fails for the Python
+# kernels instead of letting NumPy wrap it around silently
+# Parameters: result which is an ndarray of out's shape and out which is the
+# matrix to store it in
+# returns: out. OverflowError is raised when an integer result doesn't fit
+# the type code of out
+def numpy_store(result, out):
+    if out.type_code in 'hi' and result.size:
+        info = numpy.iinfo(NUMPY_TYPES[out.type_code])
+        if result.min() < info.min or result.max() > info.max:
+            raise OverflowError('result out of range for type code '
+                                + out.type_code)
+    ndarray_view(out)[...] = result
+    return out
+
+
+# Purpose: to copy an ndarray into a new matrix in one pass
+# Parameters: nd which is a one or two dimensional ndarray, or anything
+# numpy.asarray takes, and type_code which is the type to store it as. A one
+# dimensional array becomes a single column, like a list does
+# returns: the matrix
+def from_ndarray(nd, type_code='f'):
+    nd = numpy.asarray(nd)
+    if nd.ndim == 1:
+        nd = nd.reshape(-1, 1)
+    rows, columns = nd.shape
+    out = prepare_out(None, rows, columns, type_code)
+    ndarray_view(out)[...] = nd
+    return out
+
+
+# @micropython.native
+# Purpose: to copy rows into one array allocated at its final size, instead
+# of growing it a row at a time through a temporary array per row
+# Parameters: rows which is a list or tuple of rows, each a list, tuple or
+# array of columns entries, columns and type_code of the result
+# returns: the row major array
+def rows_array(rows, columns, type_code):
+    n = len(rows)
+    arr = zeros_array(type_code, n * columns)
+    # only floats go through NumPy, which would truncate floats and wrap
+    # big values stored into integer arrays instead of raising like array
+    if type_code in 'fd' and use_numpy(n * columns):
+        flat = numpy.frombuffer(arr, dtype=NUMPY_TYPES[type_code])
+        flat.reshape(n, columns)[...] = rows
+        return arr
+    o = 0
+    for row in rows:
+        if len(row) != columns:
+            raise ValueError('every row should have %d entries' % columns)
+        for v in row:
+            arr[o] = v
+            o += 1
+    return arr
+
+
+# Purpose: to index any buffer as items of a type code without copying it
+# Parameters: buf which is an array, bytearray, memoryview or anything else
+# with the buffer protocol and type_code which is the item type
+# returns: buf itself when it is already an array of that type, else a
+# memoryview of it cast to the type. MicroPython can't cast memoryviews, so
+# there bytes and bytearrays are decoded into a new array, which is a copy,
+# and anything else has to be an array of type_code already
+def buffer_array(buf, type_code):
+    if getattr(buf, 'typecode', None) == type_code:
+        return buf
+    view = memoryview(buf)
+    try:
+        return view.cast('B').cast(type_code)
+    except AttributeError:
+        pass
+    if isinstance(buf, (bytes, bytearray)):
+        if len(buf) % ITEMSIZE[type_code]:
+            raise ValueError('buffer is not a whole number of entries')
+        # MicroPython builds an array from the raw bytes of these
+        return array(type_code, buf)
+    # MicroPython's arrays have no typecode attribute but an empty slice of
+    # one prints it
+    if isinstance(buf, array) and repr(buf[:0]) == "array('%s')" % type_code:
+        return buf
+    raise ValueError("buffer should be bytes or an array of '%s'" % type_code)
+
+
+# @micropython.native
+# Purpose: to inverse of a given matrix using Gauss-Jordan elimination with
+# partial pivoting. The reduction runs in place on out, swapping rows as it
+# pivots and undoing the swaps on the columns at the end, so no identity
+# matrix has to be carried alongside it
+# Parameters: the array which is being inverted and the n by n dimensions.
+# out is an optional array of n*n entries to write the inverse into, passing
+# arr itself inverts in place and passing nothing allocates a new array of
+# type_code so arr is left untouched
+# returns: the inverse array and the ratio of the smallest to the largest
+# pivot, a cheap estimate of the reciprocal condition number. A ratio of 0
+# means the matrix is singular and the array is left partially reduced
+def inverse_helper(arr, n, out=None, type_code='f'):
+    if out is None:
+        out = array(type_code, arr)
+    elif out is not arr:
+        for i in range(n*n):
+            out[i] = arr[i]
+    piv = [0] * n
+    largest = 0.0
+    smallest = 0.0
+    for k in range(n):
+        kn = k*n
+        p = k
+        big = abs(out[kn+k])
+        for i in range(k+1, n):
+            v = abs(out[i*n+k])
+            if v > big:
+                big = v
+                p = i
+        if big == 0:
+            return out, 0.0
+        piv[k] = p
+        if p != k:
+            pn = p*n
+            for j in range(n):
+                t = out[kn+j]
+                out[kn+j] = out[pn+j]
+                out[pn+j] = t
+        if big > largest:
+            largest = big
+        if k == 0 or big < smallest:
+            smallest = big
+        scaler = 1.0 / out[kn+k]
+        out[kn+k] = 1.0
         for j in range(n):
-            copyarr[fd*n+j] *= fdScaler
-            Inv[fd*n+j] *= fdScaler
+            out[kn+j] *= scaler
         for i in range(n):
-            if i == fd:
+            if i == k:
                 continue
-            crScaler = copyarr[i*n+fd]
-            for j in range(n):
-                copyarr[i*n+j] = copyarr[i*n+j] - crScaler * copyarr[fd*n+j]
-                Inv[i*n+j] = Inv[i*n+j] - crScaler * Inv[fd*n+j]
-    return Inv
-
-def identity(n):
-    I = array('f')
-    for r in range(n):
-        for c in range(n):
-            if r == c:
-                I.append(1)
-            else:
-                I.append(0)
+            iN = i*n
+            f = out[iN+k]
+            if f != 0:
+                out[iN+k] = 0.0
+                for j in range(n):
+                    out[iN+j] -= f * out[kn+j]
+    for k in range(n-1, -1, -1):
+        p = piv[k]
+        if p != k:
+            for i in range(n):
+                iN = i*n
+                t = out[iN+k]
+                out[iN+k] = out[iN+p]
+                out[iN+p] = t
+    if largest == 0:
+        return out, 1.0
+    return out, smallest / largest
+
+def identity(n, type_code='f'):
+    I = zeros_array(type_code, n*n)
+    # the diagonal is every n + 1 entries
+    for i in range(0, n*n, n + 1):
+        I[i] = 1
     return I
 
 
@@ -107,39 +818,152 @@ def identity(n):
 class Matrix:
     # Class implementing some basic matrix operations. Hopefully efficient.
     # Skipping error handling and checking at the moment.
-    # Starting with lazy evaluation of transposition
+    # A matrix is a view onto a flat array: entry (r, c) lives at
+    # arr[offset + r*rstride + c*cstride], so transposes and sub-blocks share
+    # the array of the matrix they came from instead of copying it. They
+    # share its version too, a one entry list counting the writes to the
+    # array, so a write through any of them drops every cached factorization.
+    # MicroPython ignores __slots__, so they only save memory on a host
+    __slots__ = ('arr', 'type_code', 'offset', 'rows', 'columns', 'rstride',
+                 'cstride', 'version', 'lu_cache', 'lu_version', 'rcond')
+
     # @micropython.native
-    def __init__(self, initial=None):
+    def __init__(self, initial=None, type_code='f', share=None):
         # initial should be empty, a list of numbers, or a list of lists.
         # If it is a list of numbers then you get a vertical matrix i.e. 1 column
         # If it is a list of lists, each of the interior lists is treated as a row
-        self.transposed = False
+        # type_code is the array type the entries are stored as, one of the
+        # keys of ITEMSIZE. share is a matrix whose array and version an
+        # empty matrix takes instead of allocating its own, which is how
+        # view() makes a view without allocating an array it would throw away
+        if type_code not in ITEMSIZE:
+            raise ValueError('type_code should be one of ' + PROMOTION)
+        self.type_code = type_code
+        self.offset = 0
+        self.cstride = 1
+        self.lu_cache = None
+        self.lu_version = 0
+        self.rcond = None
         if initial:
             if isinstance(initial[0], list):
                 self.rows = len(initial)
                 self.columns = len(initial[0])
-                self.arr = array('f')
-                for i in initial:
-                    self.extend(i)
+                self.rstride = self.columns
+                self.arr = rows_array(initial, self.columns, type_code)
+                self.version = [0]
                 return
             else:
                 self.rows = len(initial)
                 self.columns = 1
-                self.arr = array('f', initial)
+                self.rstride = 1
+                self.arr = array(type_code, initial)
+                self.version = [0]
                 return
         else:
             self.rows = 0
             self.columns = 0
-            self.arr = array('f')
+            self.rstride = 0
+            if share is None:
+                self.arr = array(type_code)
+                self.version = [0]
+            else:
+                self.arr = share.arr
+                self.version = share.version
             return
 
+    # @micropython.native
+    # Purpose: to build a matrix from rows, allocating its storage once
+    # Parameters: rows which is any iterable of rows, each a list, tuple or
+    # array, and type_code which is the type to store them as
+    # returns: the matrix
+    @staticmethod
+    def from_rows(rows, type_code='f'):
+        if not isinstance(rows, (list, tuple)):
+            rows = list(rows)
+        if not rows:
+            return Matrix(None, type_code)
+        columns = len(rows[0])
+        return wrap_array(rows_array(rows, columns, type_code), len(rows),
+                          columns, type_code)
+
+    # @micropython.native
+    # Purpose: to use an existing buffer, such as a bytearray filled by a
+    # sensor driver or a file read, as the storage of a matrix without
+    # copying it. Writes to the matrix go straight to the buffer, except on
+    # MicroPython where a bytes or bytearray buf is decoded into a copy
+    # Parameters: buf which supports the buffer protocol, rows and columns of
+    # the matrix, type_code of the items in buf and offset which is the
+    # index of the first entry in items, not bytes
+    # returns: the matrix, reading buf row major
+    @staticmethod
+    def from_buffer(buf, rows, columns, type_code='f', offset=0):
+        if type_code not in ITEMSIZE:
+            raise ValueError('type_code should be one of ' + PROMOTION)
+        arr = buffer_array(buf, type_code)
+        if len(arr) < offset + rows*columns:
+            raise ValueError('buffer is too small for a %dx%d matrix'
+                             % (rows, columns))
+        out = wrap_array(arr, rows, columns, type_code)
+        out.offset = offset
+        return out
+
+    # @micropython.native
+    # Purpose: to make a matrix of zeros
+    # Parameters: rows, columns and type_code of the matrix
+    # returns: the matrix
+    @staticmethod
+    def zeros(rows, columns, type_code='f'):
+        return wrap_array(zeros_array(type_code, rows*columns), rows, columns,
+                          type_code)
+
+    # @micropython.native
+    # Purpose: to make a matrix with every entry set to one value
+    # Parameters: rows, columns, value and type_code of the matrix
+    # returns: the matrix
+    @staticmethod
+    def full(rows, columns, value, type_code='f'):
+        n = rows*columns
+        arr = zeros_array(type_code, n)
+        if n and value:
+            arr[0] = value
+            # double the filled prefix each pass rather than a loop per entry
+            filled = 1
+            while filled < n:
+                k = min(filled, n - filled)
+                arr[filled:filled + k] = arr[0:k]
+                filled += k
+        return wrap_array(arr, rows, columns, type_code)
+
+    # @micropython.native
+    # Purpose: to make a matrix of ones
+    # Parameters: rows, columns and type_code of the matrix
+    # returns: the matrix
+    @staticmethod
+    def ones(rows, columns, type_code='f'):
+        return Matrix.full(rows, columns, 1, type_code)
+
+    # @micropython.native
+    # Purpose: to make an identity matrix
+    # Parameters: n which is the number of rows and columns, and type_code
+    # returns: the matrix
+    @staticmethod
+    def eye(n, type_code='f'):
+        return wrap_array(identity(n, type_code), n, n, type_code)
+
+    # The old lazily transposed flag, true when the entries of a row are
+    # spread out down the array rather than next to each other
+    @property
+    def transposed(self):
+        return self.cstride != 1 and self.columns > 1
+
     # @micropython.native
     # Purpose: to append an array to the matrix
     # Parameters: self which is the matrix class and to_add which is a list
     # that will be added onto the array
     # returns: none
     def extend(self, to_add):
-        self.arr.extend(array('f', to_add))
+        self.arr.extend(array(self.type_code, to_add))
+        self.changed()
 
     # @micropython.native
     # Purpose: to add a row to the matrix
@@ -151,167 +975,877 @@ class Matrix:
         self.extend(row)
         if self.columns == 0:
             self.columns = len(row)
+            self.rstride = self.columns
         self.rows = self.rows + 1
 
+    # @micropython.native
+    # Purpose: to check whether the entries fill the whole array in row major
+    # order, so it can be copied or walked as one flat run
+    # Parameters: self which is the matrix class
+    # returns: True if the matrix is laid out like a freshly built one
+    def is_contiguous(self):
+        columns = self.columns
+        return (self.offset == 0 and len(self.arr) == self.rows * columns
+                and (self.cstride == 1 or columns == 1)
+                and (self.rstride == columns or self.rows == 1))
+
     # @micropython.native
     # Purpose: Transposes the matrix turning columns into rows.
     # Parameters: self which is the matrix class
-    # returns: a new instance of matrix which contains the transposed matrix
+    # returns: a new instance of matrix which contains the transposed matrix,
+    # sharing the array of this one
     def T(self):
-        out = Matrix()
-        out.arr = self.arr
-        out.transposed = not self.transposed
-        out.columns = self.get_columns()
-        out.rows = self.get_rows()
+        return self.view(self.offset, self.columns, self.rows,
+                         self.cstride, self.rstride)
+
+    # @micropython.native
+    # Purpose: to make another matrix over the same array
+    # Parameters: self which is the matrix class, the offset of entry (0, 0),
+    # the rows and columns of the view and its row and column strides
+    # returns: the view
+    def view(self, offset, rows, columns, rstride, cstride):
+        out = Matrix(None, self.type_code, self)
+        out.offset = offset
+        out.rows = rows
+        out.columns = columns
+        out.rstride = rstride
+        out.cstride = cstride
         return out
 
+    # @micropython.native
+    # Purpose: to record a write to the array, which drops the cached
+    # factorization of this matrix and of every view sharing the array
+    # Parameters: self which is the matrix class
+    # returns: none
+    def changed(self):
+        self.version[0] += 1
+
+    # @micropython.native
+    # Purpose: to get a rectangular block of the matrix without copying it
+    # Parameters: self which is the matrix class, the row and column of the
+    # top left entry of the block and its number of rows and columns
+    # returns: a matrix sharing this one's array
+    def block(self, row, column, rows, columns):
+        return self.view(self.offset + row*self.rstride + column*self.cstride,
+                         rows, columns, self.rstride, self.cstride)
+
+    # @micropython.native
+    # Purpose: to get one row of the matrix without copying it
+    # Parameters: self which is the matrix class and i which is the row,
+    # negative counts from the end
+    # returns: a 1 by columns matrix sharing this one's array
+    def row(self, i):
+        i = slice_bounds(i, self.rows)[0]
+        return self.view(self.offset + i*self.rstride, 1, self.columns,
+                         self.rstride, self.cstride)
+
+    # @micropython.native
+    # Purpose: to get one column of the matrix without copying it
+    # Parameters: self which is the matrix class and j which is the column,
+    # negative counts from the end
+    # returns: a rows by 1 matrix sharing this one's array
+    def col(self, j):
+        j = slice_bounds(j, self.columns)[0]
+        return self.view(self.offset + j*self.cstride, self.rows, 1,
+                         self.rstride, self.cstride)
+
+    # @micropython.native
+    # Purpose: to get the main diagonal without copying it
+    # Parameters: self which is the matrix class
+    # returns: a single column matrix sharing this one's array
+    def diag(self):
+        n = min(self.rows, self.columns)
+        return self.view(self.offset, n, 1, self.rstride + self.cstride,
+                         self.cstride)
+
+    # @micropython.native
+    # Purpose: to index the matrix like m[r, c], m[r0:r1, c0:c1] or m[r0:r1].
+    # Writes through a view show up in the matrix it came from
+    # Parameters: self which is the matrix class and key which is an int, a
+    # slice or a pair of them
+    # returns: the entry when both indices are ints, otherwise a view
+    # sharing this one's array. An int next to a slice keeps that dimension
+    # as 1
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rkey, ckey = key
+        else:
+            rkey = key
+            ckey = slice(None)
+        r, rows, rstep = slice_bounds(rkey, self.rows)
+        c, columns, cstep = slice_bounds(ckey, self.columns)
+        offset = self.offset + r*self.rstride + c*self.cstride
+        if isinstance(rkey, int) and isinstance(ckey, int):
+            return self.arr[offset]
+        return self.view(offset, rows, columns, self.rstride * rstep,
+                         self.cstride * cstep)
+
+    # @micropython.native
+    # Purpose: to assign to an entry or a block of the matrix
+    # Parameters: self which is the matrix class, key as for __getitem__ and
+    # value which is a number, filled into every selected entry, or a matrix
+    # of the selected shape
+    # returns: none
+    def __setitem__(self, key, value):
+        self.changed()
+        if isinstance(key, tuple) and isinstance(key[0], int) and isinstance(key[1], int):
+            r = slice_bounds(key[0], self.rows)[0]
+            c = slice_bounds(key[1], self.columns)[0]
+            self.arr[self.offset + r*self.rstride + c*self.cstride] = value
+            return
+        target = self[key]
+        arr = self.arr
+        ao, ars, acs = get_strides(target)
+        if isinstance(value, Matrix):
+            if value.rows != target.rows or value.columns != target.columns:
+                raise ValueError('can not assign a %dx%d matrix to a %dx%d '
+                                 'block' % (value.rows, value.columns,
+                                            target.rows, target.columns))
+            if value.arr is arr:
+                value = value.clone()
+            b = value.arr
+            bo, brs, bcs = get_strides(value)
+            for r in range(target.rows):
+                ia = ao + r*ars
+                ib = bo + r*brs
+                for c in range(target.columns):
+                    arr[ia] = b[ib]
+                    ia += acs
+                    ib += bcs
+            return
+        for r in range(target.rows):
+            ia = ao + r*ars
+            for c in range(target.columns):
+                arr[ia] = value
+                ia += acs
+
     # @micropython.native
     # Purpose: to attain a specific index of a the matrix
     # Parameters: self which is the matrix class, row and column are the indeces
     # in which the desired value resides
     # returns: the value that the indeces point to in the array
     def get(self, row, column):
-        if self.transposed:
-            return self.arr[column * self.columns + row]
-        return self.arr[row * self.columns + column]
+        return self.arr[self.offset + row*self.rstride + column*self.cstride]
 
     # @micropython.native
     # Purpose: to attain the number of rows in the matrix
     # Parameters: self which is the matrix class
-    # returns: the number of rows depending on whether it is tranposed or not
+    # returns: the number of rows
     def get_rows(self):
-        if self.transposed:
-            return self.columns
         return self.rows
 
     # @micropython.native
     # Purpose: to attain the number of columns in the matrix
     # Parameters: self which is the matrix class
-    # returns: the number of columns depending on whether it is tranposed or not
+    # returns: the number of columns
     def get_columns(self):
-        if self.transposed:
-            return self.rows
         return self.columns
 
     # @micropython.native
     # Purpose: to clone the existing matrix
-    # Parameters: self which is the matrix class
-    # returns: a clone that depending on transposition rows and columns
-    # copied as needed
-    def clone(self):
-        out = Matrix()
-        if self.transposed:
-            out.arr = transpose_matrix(self.arr, self.rows, self.columns, out.arr)
-        else:
-            out.arr.extend(self.arr)
-        out.columns = self.get_columns()
-        out.rows = self.get_rows()
+    # Parameters: self which is the matrix class and out which is an optional
+    # matrix whose buffer receives the copy
+    # returns: a contiguous copy, with transposed views and blocks gathered
+    # into their own array
+    def clone(self, out=None):
+        arr = self.arr
+        contiguous = self.is_contiguous()
+        if out is None and contiguous:
+            return wrap_array(array(self.type_code, arr), self.rows,
+                              self.columns, self.type_code)
+        if out is self and contiguous:
+            return self
+        ao, ars, acs = get_strides(self)
+        rows = self.rows
+        columns = self.columns
+        out = prepare_out(out, rows, columns, self.type_code, arr)
+        copy = TYPED_COPY.get(self.type_code, copy_strided)
+        copy(arr, ao, ars, acs, rows, columns, out.arr)
         return out
 
+    # @micropython.native
+    # Purpose: to convert the matrix to another storage type in one pass
+    # Parameters: self which is the matrix class and type_code which is the
+    # type code to convert to. Floats going to an integer type are
+    # truncated towards zero
+    # returns: a new contiguous matrix of that type
+    def astype(self, type_code):
+        if type_code not in ITEMSIZE:
+            raise ValueError('type_code should be one of ' + PROMOTION)
+        rows = self.rows
+        columns = self.columns
+        arr = self.arr
+        to_int = type_code in 'hi' and self.type_code in 'fd'
+        if self.is_contiguous() and not to_int:
+            return wrap_array(array(type_code, arr), rows, columns, type_code)
+        out = prepare_out(None, rows, columns, type_code)
+        res = out.arr
+        ao, ars, acs = get_strides(self)
+        o = 0
+        for r in range(rows):
+            i = ao + r*ars
+            for c in range(columns):
+                if to_int:
+                    res[o] = int(arr[i])
+                else:
+                    res[o] = arr[i]
+                o += 1
+                i += acs
+        return out
+
+    # Purpose: to hand the matrix to NumPy code without copying it
+    # Parameters: self which is the matrix class
+    # returns: an ndarray sharing this matrix's array, so writes through
+    # either one show up in the other
+    def ndarray(self):
+        if numpy is None:
+            raise ImportError('numpy is not installed')
+        return ndarray_view(self)
+
     # @micropython.native
     # Purpose: to add the biased ones needed in order to formulate a clean
     # linear regression
-    # Parameters: self which is the matrix class
+    # Parameters: self which is the matrix class and out which is an optional
+    # matrix whose buffer receives the result
     # returns: a matrix instance which accounts for the biased ones
-    def add_bias_ones(self):
-        out = Matrix()
-        if self.transposed:
-            return add_bias_ones(T(self))
-        for i in range(len(self.arr)):
-            if i % self.columns == 0:
-                out.arr.append(1)
-            out.arr.append(self.arr[i])
-        out.columns = self.get_columns() + 1
-        out.rows = self.get_rows()
-        return out
+    def add_bias_ones(self, out=None):
+        return PolynomialFeatures(self.get_columns(), 1).transform(self, out)
 
     # @micropython.native
     # Purpose: helper function to use in order to attain a polynomial regression
     # Parameters: self which is the matrix class, and the degree in which the
-    # polynomial regression will take place
-    # returns: a matrix instance which accounts for the biased ones
-    def polynomialize(self, degree):
+    # polynomial regression will take place, out which is an optional matrix
+    # whose buffer receives the result
+    # returns: a matrix instance which accounts for the biased ones, with the
+    # powers of each column one after the other. PolynomialFeatures also
+    # builds the cross terms
+    def polynomialize(self, degree, out=None):
         "This will also add the bias ones so don't use it with add_bias_ones"
-        out = Matrix()
-        for i in range(len(self.arr)):
-            if i % self.columns == 0:
-                out.arr.append(1)
-            for j in range(degree):
-                out.arr.append(self.arr[i]**(j+1))
-        out.columns = self.get_columns() * degree + 1
-        out.rows = self.get_rows()
+        expansion = PolynomialFeatures(self.get_columns(), degree, False)
+        return expansion.transform(self, out)
+
+    # Purpose: to make a matrix of zeros shaped like this one
+    # Parameters: self which is the matrix class and out which is an optional
+    # matrix whose buffer is zeroed and reused
+    # returns: the matrix of zeros
+    def weights(self, out=None):
+        if out is None:
+            return prepare_out(None, self.get_rows(), self.get_columns(),
+                               self.type_code)
+        out = prepare_out(out, self.get_rows(), self.get_columns(),
+                          self.type_code)
+        res = out.arr
+        for i in range(len(res)):
+            res[i] = 0
         return out
 
+    # @micropython.native
+    # Purpose: to add two matrices given
+    # Parameters: self which is the matrix class and an other matrix which will
+    # be added to the first, or a number, out which is an optional matrix
+    # whose buffer receives the sum. out may be self or other. A 1 by c row or
+    # an r by 1 column is broadcast across the other matrix
+    # returns: the added matrices, stored as the promotion of both type codes
+    def __add__(self, other, out=None):
+        return elementwise('add', self, other, out)
 
-    def weights(self):
-        out = Matrix()
-        for i in range(len(self)):
-            out.arr.append(0)
-        out.columns = self.get_columns()
-        out.rows = self.get_rows()
-        return  out
+    def __radd__(self, other):
+        return elementwise('add', other, self)
 
+    # @micropython.native
+    # Purpose: to subtract a matrix or a number from this one, entry by entry
+    # Parameters: self which is the matrix class, other which is a matrix or
+    # a number and out which is an optional matrix whose buffer receives the
+    # result. Broadcasts like __add__
+    # returns: the difference
+    def __sub__(self, other, out=None):
+        return elementwise('sub', self, other, out)
 
+    def __rsub__(self, other):
+        return elementwise('sub', other, self)
 
+    def __neg__(self):
+        return elementwise('mul', self, -1)
 
     # @micropython.native
-    # Purpose: to add two matrices given
-    # Parameters: self which is the matrix class and an other matrix which will
-    # be added to the first
-    # returns: the added matrices
-    def __add__(self, other):
-        "Adds two matrices. This needs a sanity check for transposition"
-        out = self.clone()
-        for r in range(other.rows):
-            rt = r * other.columns
-            for c in range(other.columns):
-                out.arr[rt+c] += other.get(r, c)
+    # Purpose: to multiply entry by entry, where * is the matrix product
+    # Parameters: self which is the matrix class, other which is a matrix or
+    # a number and out which is an optional matrix whose buffer receives the
+    # result. Broadcasts like __add__, so multiplying by a 1 by c row scales
+    # each column
+    # returns: the product
+    def multiply(self, other, out=None):
+        return elementwise('mul', self, other, out)
+
+    # @micropython.native
+    # Purpose: to divide entry by entry
+    # Parameters: self which is the matrix class, other which is a matrix or
+    # a number and out which is an optional matrix whose buffer receives the
+    # result. Broadcasts like __add__
+    # returns: the quotient, stored as floats
+    def __truediv__(self, other, out=None):
+        return elementwise('div', self, other, out)
+
+    def __rtruediv__(self, other):
+        return elementwise('div', other, self)
+
+    # @micropython.native
+    # Purpose: to raise every entry to a power
+    # Parameters: self which is the matrix class, other which is a number or
+    # a matrix of exponents and out which is an optional matrix whose buffer
+    # receives the result. Broadcasts like __add__
+    # returns: the powers, stored as floats
+    def power(self, other, out=None):
+        return elementwise('pow', self, other, out)
+
+    def __pow__(self, other):
+        return elementwise('pow', self, other)
+
+    # @micropython.native
+    # Purpose: to take the absolute value of every entry
+    # Parameters: self which is the matrix class and out which is an
+    # optional matrix whose buffer receives the result
+    # returns: the absolute values, with the type code of self
+    def __abs__(self, out=None):
+        rows = self.rows
+        columns = self.columns
+        arr = self.arr
+        ao, ars, acs = get_strides(self)
+        if use_numpy(rows*columns):
+            result = numpy.absolute(
+                ndarray_view(self), dtype=NUMPY_WORK_TYPES[self.type_code])
+            out = prepare_out(out, rows, columns, self.type_code,
+                              None if self.is_contiguous() else arr)
+            return numpy_store(result, out)
+        out = prepare_out(out, rows, columns, self.type_code,
+                          None if self.is_contiguous() else arr)
+        res = out.arr
+        o = 0
+        for r in range(rows):
+            i = ao + r*ars
+            for c in range(columns):
+                v = arr[i]
+                res[o] = -v if v < 0 else v
+                o += 1
+                i += acs
+        return out
+
+    # @micropython.native
+    # Purpose: to limit every entry to a range
+    # Parameters: self which is the matrix class, low and high which are the
+    # bounds, either may be None for no bound, and out which is an optional
+    # matrix whose buffer receives the result
+    # returns: the clipped matrix, with the type code of self
+    def clip(self, low=None, high=None, out=None):
+        rows = self.rows
+        columns = self.columns
+        arr = self.arr
+        ao, ars, acs = get_strides(self)
+        if use_numpy(rows*columns):
+            view = ndarray_view(self)
+            if self.type_code in 'hi':
+                # a float bound can't be stored in an integer array
+                if ((isinstance(low, float) and numpy.any(view < low))
+                        or (isinstance(high, float)
+                            and numpy.any(view > high))):
+                    raise TypeError('a float bound can not be stored '
+                                    'in an integer matrix')
+            out = prepare_out(out, rows, columns, self.type_code,
+                              None if self.is_contiguous() else arr)
+            if low is None and high is None:
+                # older NumPy refuses to clip without a bound
+                numpy.copyto(ndarray_view(out), view)
+            else:
+                numpy.clip(view, low, high, out=ndarray_view(out),
+                           casting='unsafe')
+            return out
+        out = prepare_out(out, rows, columns, self.type_code,
+                          None if self.is_contiguous() else arr)
+        res = out.arr
+        o = 0
+        for r in range(rows):
+            i = ao + r*ars
+            for c in range(columns):
+                v = arr[i]
+                if low is not None and v < low:
+                    v = low
+                elif high is not None and v > high:
+                    v = high
+                res[o] = v
+                o += 1
+                i += acs
+        return out
+
+    # @micropython.native
+    # Purpose: to apply any function of one number to every entry
+    # Parameters: self which is the matrix class, fn which is the function,
+    # out which is an optional matrix whose buffer receives the result and
+    # type_code which is the type of the result, that of self if not given
+    # returns: the mapped matrix
+    def map(self, fn, out=None, type_code=None):
+        if type_code is None:
+            type_code = self.type_code
+        rows = self.rows
+        columns = self.columns
+        arr = self.arr
+        ao, ars, acs = get_strides(self)
+        out = prepare_out(out, rows, columns, type_code,
+                          None if self.is_contiguous() else arr)
+        res = out.arr
+        o = 0
+        for r in range(rows):
+            i = ao + r*ars
+            for c in range(columns):
+                res[o] = fn(arr[i])
+                o += 1
+                i += acs
         return out
 
+    # @micropython.native
+    # Purpose: to add another matrix into this one without allocating
+    # Parameters: self which is the matrix class and other which is a matrix
+    # of the same shape
+    # returns: self
+    def iadd(self, other):
+        a = self.arr
+        b = other.arr
+        ao, ars, acs = get_strides(self)
+        bo, brs, bcs = get_strides(other)
+        if self.rows != other.rows or self.columns != other.columns:
+            raise ValueError('can not add a %dx%d matrix into a %dx%d one'
+                             % (other.rows, other.columns, self.rows,
+                                self.columns))
+        self.changed()
+        if self.is_contiguous() and other.is_contiguous():
+            for i in range(len(a)):
+                a[i] += b[i]
+            return self
+        if b is a and (ao != bo or ars != brs or acs != bcs):
+            b = array(other.type_code, b)
+        for r in range(self.get_rows()):
+            ia = ao + r*ars
+            ib = bo + r*brs
+            for c in range(self.get_columns()):
+                a[ia] += b[ib]
+                ia += acs
+                ib += bcs
+        return self
+
+    def __iadd__(self, other):
+        return self.iadd(other)
+
+    # @micropython.native
+    # Purpose: to scale this matrix in place without allocating
+    # Parameters: self which is the matrix class and scalar which is a float
+    # or int
+    # returns: self
+    def imul_scalar(self, scalar):
+        arr = self.arr
+        self.changed()
+        if self.is_contiguous():
+            for i in range(len(arr)):
+                arr[i] *= scalar
+            return self
+        ao, ars, acs = get_strides(self)
+        for r in range(self.rows):
+            i = ao + r*ars
+            for c in range(self.columns):
+                arr[i] *= scalar
+                i += acs
+        return self
+
     # @micropython.native
     # Purpose: to cross multiply two matrices given
     # Parameters: self which is the matrix class and an other matrix which will
-    # be added to the first
-    # returns: the multiplied matrix
-    def __mul__(self, other):
-        out = Matrix()
+    # be added to the first, out which is an optional matrix whose buffer
+    # receives the product. For a scalar out may be self
+    # returns: the multiplied matrix. An int scalar promotes the type code
+    # to at least 'i', like a matrix product, and a float scalar to at least
+    # 'f'
+    def __mul__(self, other, out=None):
+        a = self.arr
+        ao, ars, acs = get_strides(self)
         if isinstance(other, float) or isinstance(other, int):
-            out.columns = self.columns
-            out.rows = self.rows
-            for i in self.arr:
-                out.arr.append(i * other)
+            rows = self.rows
+            columns = self.columns
+            type_code = promote(self.type_code, 'i')
+            if isinstance(other, float):
+                type_code = promote(type_code, 'f')
+            if use_numpy(rows*columns):
+                result = numpy.multiply(ndarray_view(self), other,
+                                        dtype=NUMPY_WORK_TYPES[type_code])
+                out = prepare_out(out, rows, columns, type_code,
+                                  None if self.is_contiguous() else a)
+                return numpy_store(result, out)
+            if self.is_contiguous():
+                out = prepare_out(out, rows, columns, type_code)
+                res = out.arr
+                for i in range(len(a)):
+                    res[i] = a[i] * other
+                return out
+            out = prepare_out(out, rows, columns, type_code, a)
+            res = out.arr
+            o = 0
+            for r in range(rows):
+                i = ao + r*ars
+                for c in range(columns):
+                    res[o] = a[i] * other
+                    o += 1
+                    i += acs
             return out
         # Out will have as many rows as self and as many columns as other
-        out.rows = self.get_rows()
-        out.columns = other.get_columns()
-        for r in range(out.get_rows()):
-            for c in range(out.get_columns()):
-                cross = 0
-                # Would this be faster as a sum of a comprehension?
-                for i in range(self.get_columns()):
-                    cross += self.get(r, i) * other.get(i, c)
-                out.arr.append(cross)
+        inner = self.get_columns()
+        if inner != other.get_rows():
+            raise ValueError('can not multiply a %dx%d matrix by a %dx%d one'
+                             % (self.get_rows(), inner, other.get_rows(),
+                                other.get_columns()))
+        b = other.arr
+        bo, brs, bcs = get_strides(other)
+        type_code = promote(promote(self.type_code, other.type_code), 'i')
+        if use_numpy(self.get_rows() * inner * other.get_columns()):
+            result = numpy.matmul(ndarray_view(self), ndarray_view(other),
+                                  dtype=NUMPY_WORK_TYPES[type_code])
+            out = prepare_out(out, self.get_rows(), other.get_columns(),
+                              type_code, a, b)
+            return numpy_store(result, out)
+        out = prepare_out(out, self.get_rows(), other.get_columns(),
+                          type_code, a, b)
+        matmul_kernel(a, ao, ars, acs, b, bo, brs, bcs,
+                      out.arr, out.rows, inner, out.columns)
         return out
 
+    # Purpose: to multiply a number by this matrix, as in 2 * m
+    # Parameters: self which is the matrix class and other which is an int or
+    # a float
+    # returns: the scaled matrix, typed as for __mul__
+    def __rmul__(self, other):
+        if isinstance(other, float) or isinstance(other, int):
+            return self.__mul__(other)
+        return NotImplemented
+
+    # @micropython.native
+    # Purpose: to find X^T X for this matrix X, the left hand side of the
+    # normal equations, reading the array directly instead of building and
+    # multiplying by a transposed copy. Symmetry halves the work
+    # Parameters: self which is the matrix class and out which is an
+    # optional matrix whose buffer receives the result
+    # returns: a new square matrix with as many rows as self has columns,
+    # stored as floats since it is headed for a solver
+    def gram(self, out=None):
+        n = self.get_columns()
+        rows = self.get_rows()
+        a = self.arr
+        ao, ars, acs = get_strides(self)
+        type_code = float_type(self.type_code)
+        if use_numpy(rows * n * n):
+            view = ndarray_view(self)
+            out = prepare_out(out, n, n, type_code, a)
+            numpy.matmul(view.T, view, out=ndarray_view(out),
+                         dtype=NUMPY_WORK_TYPES[type_code], casting='unsafe')
+            return out
+        out = prepare_out(out, n, n, type_code, a)
+        gram_kernel(a, ao, ars, acs, rows, n, out.arr)
+        return out
+
+    # @micropython.native
+    # Purpose: to find X^T * other for this matrix X without transposing it,
+    # the right hand side of the normal equations
+    # Parameters: self which is the matrix class, other which is a matrix
+    # with as many rows as self and out which is an optional matrix whose
+    # buffer receives the result
+    # returns: a new matrix with as many rows as self has columns and as many
+    # columns as other, stored as floats like gram
+    def tmul(self, other, out=None):
+        a = self.arr
+        b = other.arr
+        inner = self.get_rows()
+        if inner != other.get_rows():
+            raise ValueError('can not multiply the transpose of a %dx%d '
+                             'matrix by a %dx%d one'
+                             % (inner, self.get_columns(), other.get_rows(),
+                                other.get_columns()))
+        ao, ars, acs = get_strides(self)
+        bo, brs, bcs = get_strides(other)
+        type_code = float_type(promote(self.type_code, other.type_code))
+        if use_numpy(inner * self.get_columns() * other.get_columns()):
+            av = ndarray_view(self)
+            bv = ndarray_view(other)
+            out = prepare_out(out, self.get_columns(), other.get_columns(),
+                              type_code, a, b)
+            numpy.matmul(av.T, bv, out=ndarray_view(out),
+                         dtype=NUMPY_WORK_TYPES[type_code], casting='unsafe')
+            return out
+        out = prepare_out(out, self.get_columns(), other.get_columns(),
+                          type_code, a, b)
+        # reading X with its strides swapped reads X^T
+        matmul_kernel(a, ao, acs, ars, b, bo, brs, bcs,
+                      out.arr, out.rows, inner, out.columns)
+        return out
+
+    # @micropython.native
+    # Purpose: to evaluate a fitted model, such as the result of
+    # lin_regression, on one set of features without building any matrices.
+    # The coefficients are read in place from this matrix
+    # Parameters: self which is the coefficient matrix with one row per
+    # coefficient, vec which is a list, tuple or array of features and bias
+    # which says whether the first coefficient is the bias term. Only the
+    # first rows - 1 entries of vec are read when bias is set, so sensor
+    # readings can be passed in as they come
+    # returns: the prediction for the first output column
+    def dot_vec(self, vec, bias=True):
+        ao, ars, acs = get_strides(self)
+        arr = self.arr
+        n = self.get_rows()
+        s = 0.0
+        if bias:
+            s = arr[ao]
+            ao += ars
+            n -= 1
+        for i in range(n):
+            s += arr[ao] * vec[i]
+            ao += ars
+        return s
+
+    # @micropython.native
+    # Purpose: to evaluate a fitted model with several outputs on one set of
+    # features, writing the predictions into a buffer the caller keeps
+    # Parameters: self which is the coefficient matrix, features which is a
+    # list, tuple or array of features, out which is an array or list with
+    # one entry per output column and bias as in dot_vec
+    # returns: out
+    def predict_into(self, features, out, bias=True):
+        ao, ars, acs = get_strides(self)
+        arr = self.arr
+        n = self.get_rows()
+        if bias:
+            n -= 1
+        for c in range(self.get_columns()):
+            i = ao + c*acs
+            s = 0.0
+            if bias:
+                s = arr[i]
+                i += ars
+            for j in range(n):
+                s += arr[i] * features[j]
+                i += ars
+            out[c] = s
+        return out
+
+
+    # @micropython.native
+    # Purpose: to get an array holding every entry of a square matrix that
+    # can be read as n*n row major storage, or as its transpose for
+    # operations that give the same answer either way
+    # Parameters: self which is the matrix class
+    # returns: the array, which is this matrix's own when it is a whole
+    # array and a compact copy for any other view
+    def square_storage(self):
+        n = self.rows
+        if (self.offset == 0 and len(self.arr) == n*n
+                and (self.cstride == 1 or self.rstride == 1)):
+            return self.arr
+        return self.clone().arr
+
     # @micropython.native
     # Purpose: to find the determinant of a matrix
     # Parameters: the array which a determinant is being calculated for
     # returns: the determinant of the matrix
     def determinant(self):
         if self.rows == self.columns :
-            return determinant_helper(self.arr, self.rows)
+            # transposing doesn't change the determinant
+            return determinant_helper(self.square_storage(), self.rows,
+                                      float_type(self.type_code))
         else:
             return 0
 
+    # @micropython.native
+    # Purpose: to factor a square matrix into packed LU form so it can be
+    # solved against repeatedly. The factorization is cached on the matrix
+    # until its array is written to, through it or through any view of it
+    # Parameters: self which is the matrix class
+    # returns: an LU instance, or None if the matrix is not square
+    def factorize(self):
+        if self.get_rows() != self.get_columns():
+            return None
+        if self.lu_cache is None or self.lu_version != self.version[0]:
+            self.lu_cache = LU(self)
+            self.lu_version = self.version[0]
+        return self.lu_cache
+
+    # @micropython.native
+    # Purpose: to factor a symmetric positive definite matrix, such as the
+    # ridge normal equations alpha + xT * x, into its Cholesky factor. This
+    # is about half the work of an LU factorization
+    # Parameters: self which is the matrix class
+    # returns: a Cholesky instance, or None if the matrix is not square or
+    # not positive definite
+    def cholesky(self):
+        n = self.get_rows()
+        if n != self.get_columns():
+            return None
+        type_code = float_type(self.type_code)
+        L = zeros_array(type_code, n*(n+1)//2)
+        # symmetric, so the storage can be read whether transposed or not
+        if not cholesky_decompose(self.square_storage(), n, L):
+            return None
+        return Cholesky(L, n, type_code)
+
+    # @micropython.native
+    # Purpose: to solve A x = b when A is symmetric positive definite
+    # Parameters: self which is the matrix class and b which is a list, array
+    # or matrix with as many rows as self
+    # returns: the solution with the same number of columns as b, or None if
+    # self is not positive definite
+    def solve_spd(self, b):
+        factor = self.cholesky()
+        if factor is None:
+            return None
+        if isinstance(b, Matrix):
+            return factor.solve_many(b)
+        return factor.solve(b)
+
     # @micropython.native
     # Purpose: to find the inverse of a matrix
-    # Parameters: the array which a determinant is being calculated for
-    # returns: the inverse of the matrix
-    def get_inverse(self):
-        out = Matrix()
-        out.arr = inverse_helper(self.arr, self.get_columns())
-        out.columns = self.get_columns()
-        out.rows = self.get_rows()
+    # Parameters: self which is the matrix class. out is an optional matrix
+    # whose buffer receives the inverse, and inplace=True inverts this
+    # matrix's own buffer instead so nothing is allocated. A singular matrix
+    # inverted in place is left part way through the reduction, except for
+    # integer matrices and views that aren't a whole array, which are reduced
+    # in a copy and left untouched. By default a new matrix is returned and
+    # self is left untouched
+    # returns: the inverse of the matrix with its reciprocal condition
+    # estimate stored in rcond, or None if the matrix is singular
+    def get_inverse(self, out=None, inplace=False):
+        n = self.get_columns()
+        if self.get_rows() != n:
+            return None
+        # The inverse of a transposed view is the transposed inverse of its
+        # storage, so a whole array is inverted as is and keeps its strides.
+        # Other views, and integer matrices, are inverted through a compact
+        # float copy
+        type_code = float_type(self.type_code)
+        if self.type_code != type_code:
+            src = self.astype(type_code).arr
+        else:
+            src = self.square_storage()
+        if src is self.arr:
+            rstride = self.rstride
+            cstride = self.cstride
+        else:
+            rstride = n
+            cstride = 1
+        if inplace:
+            arr, rcond = inverse_helper(src, n, src)
+            out = self
+            if rcond == 0 and src is not self.arr:
+                return None
+            if src is self.arr:
+                pass
+            elif self.type_code == type_code:
+                ao, ars, acs = get_strides(self)
+                for r in range(n):
+                    for c in range(n):
+                        self.arr[ao + r*ars + c*acs] = src[r*n + c]
+            else:
+                # an integer matrix can't hold its inverse so it takes over
+                # the float copy
+                out.arr = arr
+                out.version = [0]
+                out.type_code = type_code
+                out.offset = 0
+                out.rstride = rstride
+                out.cstride = cstride
+        else:
+            if out is None:
+                out = Matrix(None, type_code)
+            if (len(out.arr) != n*n or out.arr is src
+                    or out.type_code != type_code):
+                arr, rcond = inverse_helper(src, n, None, type_code)
+            else:
+                arr, rcond = inverse_helper(src, n, out.arr)
+            if arr is not out.arr:
+                out.arr = arr
+                out.version = [0]
+            out.type_code = type_code
+            out.offset = 0
+            out.rows = n
+            out.columns = n
+            out.rstride = rstride
+            out.cstride = cstride
+        out.changed()
+        if rcond == 0:
+            return None
+        out.rcond = rcond
+        return out
+
+    # @micropython.native
+    # Purpose: to write the matrix to a file so a fitted model survives a
+    # reboot. The HEADER is followed by the entries as raw array bytes in
+    # one write. A transposed whole array is written as it is stored with
+    # the transposed flag set, other views are written as a compact copy
+    # Parameters: self which is the matrix class and f which is a file
+    # opened in binary mode, or a path to write to. Several matrices can be
+    # saved one after the other to the same file
+    # returns: none
+    def save(self, f):
+        if isinstance(f, str):
+            with open(f, 'wb') as stream:
+                self.save(stream)
+            return
+        flags = 0
+        if self.is_contiguous():
+            arr = self.arr
+        elif (self.offset == 0 and len(self.arr) == self.rows*self.columns
+                and self.rstride == 1 and self.cstride == self.rows):
+            arr = self.arr
+            flags = TRANSPOSED
+        else:
+            arr = self.clone().arr
+        f.write(struct.pack(HEADER, MAGIC, FORMAT_VERSION,
+                            ord(self.type_code), flags, 0,
+                            self.rows, self.columns))
+        f.write(arr)
+
+    # @micropython.native
+    # Purpose: to read and check the header save writes, leaving f at the
+    # first entry
+    # Parameters: f which is a file opened in binary mode
+    # returns: the type code, flags, rows and columns of the saved matrix
+    @staticmethod
+    def load_header(f):
+        header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            raise ValueError('not a saved matrix')
+        magic, version, type_code, flags, pad, rows, columns = struct.unpack(
+            HEADER, header)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('not a saved matrix')
+        type_code = chr(type_code)
+        if type_code not in ITEMSIZE:
+            raise ValueError('not a saved matrix')
+        return type_code, flags, rows, columns
+
+    # @micropython.native
+    # Purpose: to read a matrix written by save. The entries are read
+    # straight into the matrix's array with readinto, so there is no parsing
+    # and no temporary copy
+    # Parameters: f which is a file opened in binary mode, or a path, and out
+    # which is an optional matrix whose buffer is reused when it is the right
+    # size and type
+    # returns: the matrix
+    @staticmethod
+    def load(f, out=None):
+        if isinstance(f, str):
+            with open(f, 'rb') as stream:
+                return Matrix.load(stream, out)
+        type_code, flags, rows, columns = Matrix.load_header(f)
+        out = prepare_out(out, rows, columns, type_code)
+        size = rows * columns * ITEMSIZE[type_code]
+        if f.readinto(out.arr) != size and size:
+            raise ValueError('saved matrix is truncated')
+        if flags & TRANSPOSED:
+            out.rstride = 1
+            out.cstride = rows
         return out
 
     def check_invmatrix(arr,inv,n):
@@ -320,24 +1854,850 @@ class Matrix:
             return inv
         return inv
 
+    # @micropython.native
+    # Purpose: to format the matrix a row at a time, reading the entries in
+    # place so transposed views and blocks aren't copied first. Matrices with
+    # more than max_rows rows or max_columns columns show their first and
+    # last ones around an ellipsis
+    # Parameters: self which is the matrix class, precision which is the
+    # number of significant digits for floats and max_rows and max_columns
+    # which are the most rows and columns shown
+    # returns: a generator of the lines, each ending in a newline
+    def format_lines(self, precision=4, max_rows=20, max_columns=20):
+        arr = self.arr
+        ao, ars, acs = get_strides(self)
+        if self.type_code in 'hi':
+            fmt = '%d'
+        else:
+            fmt = '%.' + str(precision) + 'g'
+        columns = shown_indices(self.columns, max_columns)
+        rows = shown_indices(self.rows, max_rows)
+        last = len(rows) - 1
+        if last < 0:
+            yield '[]\n'
+            return
+        for k in range(len(rows)):
+            r = rows[k]
+            start = '[' if k == 0 else ' '
+            end = ']\n' if k == last else '\n'
+            if r is None:
+                yield start + '...' + end
+                continue
+            i = ao + r*ars
+            entries = ['...' if c is None else fmt % arr[i + c*acs]
+                       for c in columns]
+            yield start + '[' + ', '.join(entries) + ']' + end
+
+    # @micropython.native
+    # Purpose: to print the matrix without building it as one string, so a
+    # model can be shown from a control loop without stalling it
+    # Parameters: self which is the matrix class, stream which is anything
+    # with a write method, stdout if not given, and precision, max_rows and
+    # max_columns as for format_lines
+    # returns: none
+    def dump(self, stream=None, precision=4, max_rows=20, max_columns=20):
+        for line in self.format_lines(precision, max_rows, max_columns):
+            if stream is None:
+                print(line, end='')
+            else:
+                stream.write(line)
+
+    def __repr__(self):
+        return ''.join(self.format_lines())[:-1]
+
     # @micropython.native
     # Purpose: to attain the matrix in string format
     # Parameters: the array which a determinant is being calculated for
     # returns: a string which contains the matrix and all of its values in the
-    # correct order
+    # correct order, built with a single join
     def __str__(self):
-        if self.transposed:
-            return str(self.clone())
-        out = "[\\n"
-        for i in range(self.get_rows()):
-            out += "["
-            for j in range(self.get_columns()):
-                out += str(self.arr[i*self.get_columns() + j]) + ","
-            out += "],\\n"
-        out +="]"
+        arr = self.arr
+        ao, ars, acs = get_strides(self)
+        lines = ['[\n']
+        for r in range(self.rows):
+            i = ao + r*ars
+            lines.append('[' + ''.join([str(arr[i + c*acs]) + ','
+                                        for c in range(self.columns)])
+                         + '],\n')
+        lines.append(']')
+        return ''.join(lines)
+
+
+
+class Scaler:
+    # Per column feature scaling, z = (x - shift) / scale. 'standard' uses
+    # the mean and standard deviation, kept up to date with Welford's running
+    # update so the data is streamed through once and never held twice.
+    # 'minmax' maps each column's range onto [0, 1]. Constant columns get a
+    # scale of 1 so they are only shifted. Hand a fitted Scaler to
+    # PolynomialFeatures to scale inside the expansion, before the powers
+    # are taken, and fold the coefficients back onto the raw features after
+    # @micropython.native
+    def __init__(self, columns, mode='standard'):
+        if mode != 'standard' and mode != 'minmax':
+            raise ValueError("mode should be 'standard' or 'minmax'")
+        self.columns = columns
+        self.mode = mode
+        self.reset()
+
+    # @micropython.native
+    # Purpose: to forget every sample seen so far
+    # Parameters: self which is the Scaler class
+    # returns: none
+    def reset(self):
+        n = self.columns
+        self.count = 0
+        self.mean = [0.0] * n
+        self.m2 = [0.0] * n
+        self.low = [float('inf')] * n
+        self.high = [float('-inf')] * n
+        self.shift = [0.0] * n
+        self.inv = [1.0] * n
+
+    # @micropython.native
+    # Purpose: to fold more samples into the running statistics
+    # Parameters: self which is the Scaler class and x which is a matrix with
+    # one column per feature, any view of one will do
+    # returns: self, so fitting and chaining read naturally
+    def partial_fit(self, x):
+        if x.get_columns() != self.columns:
+            raise ValueError('expected %d feature columns' % self.columns)
+        rows = x.get_rows()
+        columns = self.columns
+        mean = self.mean
+        m2 = self.m2
+        low = self.low
+        high = self.high
+        standard = self.mode == 'standard'
+        if use_numpy(rows * columns) and rows:
+            view = ndarray_view(x).astype(numpy.float64)
+            if standard:
+                # Chan's pairwise merge of this batch into the running totals
+                n = self.count
+                total = n + rows
+                batch_mean = view.mean(0)
+                batch_m2 = ((view - batch_mean) ** 2).sum(0)
+                for c in range(columns):
+                    delta = float(batch_mean[c]) - mean[c]
+                    mean[c] += delta * rows / total
+                    m2[c] += float(batch_m2[c]) + delta * delta * n * rows / total
+            else:
+                batch_low = view.min(0)
+                batch_high = view.max(0)
+                for c in range(columns):
+                    low[c] = min(low[c], float(batch_low[c]))
+                    high[c] = max(high[c], float(batch_high[c]))
+            self.count += rows
+            self.update()
+            return self
+        arr = x.arr
+        xo, xrs, xcs = get_strides(x)
+        count = self.count
+        for r in range(rows):
+            i = xo + r*xrs
+            count += 1
+            for c in range(columns):
+                v = arr[i + c*xcs]
+                if standard:
+                    delta = v - mean[c]
+                    mean[c] += delta / count
+                    m2[c] += delta * (v - mean[c])
+                else:
+                    if v < low[c]:
+                        low[c] = v
+                    if v > high[c]:
+                        high[c] = v
+        self.count = count
+        self.update()
+        return self
+
+    # @micropython.native
+    # Purpose: to fit the scaling to a matrix of samples from scratch
+    # Parameters: self which is the Scaler class and x which is a matrix with
+    # one column per feature
+    # returns: self
+    def fit(self, x):
+        self.reset()
+        return self.partial_fit(x)
+
+    # @micropython.native
+    # Purpose: to turn the running statistics into the shift and the
+    # reciprocal scale that transform uses
+    # Parameters: self which is the Scaler class
+    # returns: none
+    def update(self):
+        if not self.count:
+            return
+        for c in range(self.columns):
+            if self.mode == 'standard':
+                shift = self.mean[c]
+                scale = sqrt(self.m2[c] / self.count)
+            else:
+                shift = self.low[c]
+                scale = self.high[c] - self.low[c]
+            self.shift[c] = shift
+            self.inv[c] = 1 / scale if scale > 0 else 1.0
+
+    # @micropython.native
+    # Purpose: to scale a matrix of samples
+    # Parameters: self which is the Scaler class, x which is a matrix with
+    # one column per feature and out which is an optional matrix whose buffer
+    # receives the result
+    # returns: the scaled matrix, stored as floats
+    def transform(self, x, out=None):
+        expansion = PolynomialFeatures(self.columns, 1, bias=False, scaler=self)
+        return expansion.transform(x, out)
+
+    # @micropython.native
+    # Purpose: to scale a single sample
+    # Parameters: self which is the Scaler class, row which holds the raw
+    # features and out which is an optional buffer for the result, a new
+    # float array is made if it isn't given
+    # returns: the buffer holding the scaled sample
+    def transform_row(self, row, out=None):
+        if out is None:
+            out = zeros_array('f', self.columns)
+        shift = self.shift
+        inv = self.inv
+        for c in range(self.columns):
+            out[c] = (row[c] - shift[c]) * inv[c]
+        return out
+
+
+class PolynomialFeatures:
+    # Expands raw features into a polynomial basis: a column of bias ones
+    # followed by one column per monomial up to degree. Each monomial is kept
+    # as a (parent, input) pair meaning the parent monomial's column times an
+    # input feature, so every column costs one multiply by reusing a lower
+    # degree instead of raising to a power. With interactions the basis is
+    # every monomial, ordered by degree: x0, x1, x0^2, x0 x1, x1^2, ...
+    # Without them only the powers of each feature are kept, in the order
+    # polynomialize has always used: x0, x0^2, ..., x1, x1^2, ...
+    # A fitted Scaler scales the inputs as they are read, so the powers stay
+    # near 1 instead of reaching 1e10 for raw intensities
+    # @micropython.native
+    def __init__(self, features, degree, interactions=True, bias=True,
+                 scaler=None):
+        self.features = features
+        self.degree = degree
+        self.interactions = interactions
+        self.bias = bias
+        self.scaler = scaler
+        parents = []
+        inputs = []
+        if interactions:
+            # a term only takes inputs from its own last input onwards, so
+            # each monomial is built exactly once
+            level = []
+            if degree > 0:
+                for j in range(features):
+                    level.append(len(inputs))
+                    parents.append(-1)
+                    inputs.append(j)
+            for d in range(1, degree):
+                next_level = []
+                for t in level:
+                    for j in range(inputs[t], features):
+                        next_level.append(len(inputs))
+                        parents.append(t)
+                        inputs.append(j)
+                level = next_level
+        else:
+            for j in range(features):
+                parent = -1
+                for d in range(degree):
+                    parents.append(parent)
+                    parent = len(inputs)
+                    inputs.append(j)
+        # a parent of -1 is the constant 1, i.e. a degree one term
+        self.parents = array('i', parents)
+        self.inputs = array('i', inputs)
+        self.start = 1 if bias else 0
+        self.width = self.start + len(inputs)
+        # scratch for transform_row so predictions don't allocate
+        self.row = zeros_array('f', self.width)
+        self.values = [0] * len(inputs)
+
+    # @micropython.native
+    # Purpose: to expand every row of a matrix of raw features
+    # Parameters: self which is the PolynomialFeatures class, x which is a
+    # matrix with one column per feature, any view of one will do, and out
+    # which is an optional matrix whose buffer receives the result
+    # returns: the expanded matrix with width columns. Degree one keeps the
+    # type code of x, higher degrees and scaled inputs are stored as floats
+    # since powers of integer counts soon overflow
+    def transform(self, x, out=None):
+        if x.get_columns() != self.features:
+            raise ValueError('expected %d feature columns' % self.features)
+        rows = x.get_rows()
+        width = self.width
+        start = self.start
+        parents = self.parents
+        inputs = self.inputs
+        terms = len(inputs)
+        scaler = self.scaler
+        type_code = x.type_code
+        if self.degree > 1 or scaler is not None:
+            type_code = float_type(type_code)
+        arr = x.arr
+        xo, xrs, xcs = get_strides(x)
+        if use_numpy(rows * width):
+            view = ndarray_view(x)
+            if scaler is not None:
+                view = (view - numpy.array(scaler.shift)) * numpy.array(scaler.inv)
+            work = numpy.empty((rows, terms), NUMPY_WORK_TYPES[type_code])
+            for t in range(terms):
+                p = parents[t]
+                if p < 0:
+                    work[:, t] = view[:, inputs[t]]
+                else:
+                    numpy.multiply(work[:, p], view[:, inputs[t]],
+                                   out=work[:, t])
+            out = prepare_out(out, rows, width, type_code, arr)
+            res = ndarray_view(out)
+            if start:
+                res[:, 0] = 1
+            res[:, start:] = work
+            return out
+        out = prepare_out(out, rows, width, type_code, arr)
+        res = out.arr
+        # the products are built at full precision and only rounded as they
+        # are stored, the same as the powers polynomialize used to keep
+        values = [0] * terms
+        if scaler is not None:
+            shift = scaler.shift
+            inv = scaler.inv
+        o = 0
+        for r in range(rows):
+            i = xo + r*xrs
+            if start:
+                res[o] = 1
+            base = o + start
+            for t in range(terms):
+                j = inputs[t]
+                v = arr[i + j*xcs]
+                if scaler is not None:
+                    v = (v - shift[j]) * inv[j]
+                p = parents[t]
+                if p >= 0:
+                    v *= values[p]
+                values[t] = v
+                res[base + t] = v
+            o += width
+        return out
+
+    # @micropython.native
+    # Purpose: to expand a single sample, such as a sensor reading at predict
+    # time, without building any matrices
+    # Parameters: self which is the PolynomialFeatures class, row which is a
+    # list, tuple or array of the raw features and out which is an optional
+    # buffer of width entries, a scratch buffer is reused if it isn't given
+    # returns: the buffer holding the expanded row
+    def transform_row(self, row, out=None):
+        if out is None:
+            out = self.row
+        start = self.start
+        parents = self.parents
+        inputs = self.inputs
+        values = self.values
+        scaler = self.scaler
+        if start:
+            out[0] = 1
+        for t in range(len(inputs)):
+            j = inputs[t]
+            v = row[j]
+            if scaler is not None:
+                v = (v - scaler.shift[j]) * scaler.inv[j]
+            p = parents[t]
+            if p >= 0:
+                v *= values[p]
+            values[t] = v
+            out[start + t] = v
+        return out
+
+    # @micropython.native
+    # Purpose: to evaluate a model fitted on this expansion on one sample
+    # Parameters: self which is the PolynomialFeatures class, coefficients
+    # which is the fitted coefficient matrix with one row per column of the
+    # expansion, before any fold, and row which holds the raw features
+    # returns: the prediction for the first output column
+    def predict(self, coefficients, row):
+        return coefficients.dot_vec(self.transform_row(row), False)
+
+    # @micropython.native
+    # Purpose: to rewrite coefficients fitted on the scaled expansion as
+    # coefficients of the same expansion of the raw features, so the model
+    # can be used without the scaler. Every scaled monomial is multiplied out
+    # into raw monomials of the same or lower degree, which the basis always
+    # holds since it is built up one input at a time
+    # Parameters: self which is the PolynomialFeatures class and coefficients
+    # which is the fitted matrix with one row per column of the expansion
+    # returns: the raw feature coefficients, the same shape as coefficients
+    def fold(self, coefficients):
+        scaler = self.scaler
+        if scaler is None:
+            return coefficients.clone()
+        if not self.bias:
+            raise ValueError('folding a scaled expansion needs the bias column')
+        parents = self.parents
+        inputs = self.inputs
+        start = self.start
+        shift = scaler.shift
+        inv = scaler.inv
+        outputs = coefficients.get_columns()
+        raw = [[coefficients.get(0, o) for o in range(outputs)]]
+        raw += [[0.0] * outputs for t in range(len(inputs))]
+        # each monomial as its sorted tuple of inputs, to find its column
+        factors = []
+        column = {(): 0}
+        for t in range(len(inputs)):
+            p = parents[t]
+            factors.append((factors[p] if p >= 0 else ()) + (inputs[t],))
+            column[factors[t]] = start + t
+        for t in range(len(inputs)):
+            # (x_j - shift_j) * inv_j for every factor, multiplied out
+            terms = {(): 1.0}
+            for j in factors[t]:
+                product = {}
+                for key in terms:
+                    v = terms[key] * inv[j]
+                    grown = key + (j,)
+                    product[grown] = product.get(grown, 0.0) + v
+                    product[key] = product.get(key, 0.0) - v * shift[j]
+                terms = product
+            for o in range(outputs):
+                c = coefficients.get(start + t, o)
+                for key in terms:
+                    raw[column[key]][o] += c * terms[key]
+        return Matrix(raw, float_type(coefficients.type_code))
+
+
+
+class LU:
+    # Packed LU factorization of a square matrix, made by Matrix.factorize().
+    # The n*n factors and the n pivot rows share one flat array, so solving
+    # against the factorization again only costs O(n^2)
+    # @micropython.native
+    def __init__(self, matrix):
+        n = matrix.get_rows()
+        source = matrix
+        if not matrix.is_contiguous():
+            source = matrix.clone()
+        self.n = n
+        self.type_code = float_type(matrix.type_code)
+        self.arr = array(self.type_code, source.arr)
+        self.arr.extend(zeros_array(self.type_code, n))
+        self.sign = lu_decompose(self.arr, n, memoryview(self.arr)[n*n:])
+
+    # @micropython.native
+    # Purpose: to check whether the factored matrix can be solved against
+    # Parameters: self which is the LU class
+    # returns: True if one of the pivots is zero
+    def singular(self):
+        n = self.n
+        for k in range(n):
+            if self.arr[k*n+k] == 0:
+                return True
+        return False
+
+    # @micropython.native
+    # Purpose: to solve A x = b for a single right hand side
+    # Parameters: self which is the LU class and b which is a list, array or
+    # single column matrix with n entries
+    # returns: a single column matrix containing x, or None if the factored
+    # matrix is singular
+    def solve(self, b):
+        if self.singular():
+            return None
+        if isinstance(b, Matrix):
+            out = b.astype(self.type_code)
+        else:
+            out = wrap_array(array(self.type_code, b), self.n, 1,
+                             self.type_code)
+        lu_solve(self.arr, self.n, out.arr)
+        return out
+
+    # @micropython.native
+    # Purpose: to solve A X = B for every column of B at once
+    # Parameters: self which is the LU class and B which is a matrix with n
+    # rows
+    # returns: a matrix the same shape as B containing X, or None if the
+    # factored matrix is singular
+    def solve_many(self, B):
+        if self.singular():
+            return None
+        out = B.astype(self.type_code)
+        columns = out.get_columns()
+        for c in range(columns):
+            lu_solve(self.arr, self.n, out.arr, c, columns)
+        return out
+
+    # @micropython.native
+    # Purpose: to find the determinant from the factors
+    # Parameters: self which is the LU class
+    # returns: the determinant of the factored matrix
+    def determinant(self):
+        n = self.n
+        determinant = self.sign
+        for k in range(n):
+            determinant *= self.arr[k*n+k]
+        return determinant
+
+    # @micropython.native
+    # Purpose: to find the inverse from the factors by solving against the
+    # identity
+    # Parameters: self which is the LU class
+    # returns: the inverse of the factored matrix, or None if it is singular
+    def inverse(self):
+        if self.singular():
+            return None
+        out = wrap_array(identity(self.n, self.type_code), self.n, self.n,
+                         self.type_code)
+        for c in range(self.n):
+            lu_solve(self.arr, self.n, out.arr, c, self.n)
         return out
 
 
+class Cholesky:
+    # Cholesky factor L of a symmetric positive definite matrix, made by
+    # Matrix.cholesky(). Only the lower triangle is stored, packed by rows
+    # in an array of type_code
+    # @micropython.native
+    def __init__(self, L, n, type_code='f'):
+        self.arr = L
+        self.n = n
+        self.type_code = type_code
+
+    # @micropython.native
+    # Purpose: to solve A x = b for a single right hand side
+    # Parameters: self which is the Cholesky class and b which is a list,
+    # array or single column matrix with n entries
+    # returns: a single column matrix containing x
+    def solve(self, b):
+        if isinstance(b, Matrix):
+            out = b.astype(self.type_code)
+        else:
+            out = wrap_array(array(self.type_code, b), self.n, 1,
+                             self.type_code)
+        cholesky_solve(self.arr, self.n, out.arr)
+        return out
+
+    # @micropython.native
+    # Purpose: to solve A X = B for every column of B at once
+    # Parameters: self which is the Cholesky class and B which is a matrix
+    # with n rows
+    # returns: a matrix the same shape as B containing X
+    def solve_many(self, B):
+        out = B.astype(self.type_code)
+        columns = out.get_columns()
+        for c in range(columns):
+            cholesky_solve(self.arr, self.n, out.arr, c, columns)
+        return out
+
+    # @micropython.native
+    # Purpose: to find the determinant from the factor
+    # Parameters: self which is the Cholesky class
+    # returns: the determinant, the squared product of the diagonal of L
+    def determinant(self):
+        determinant = 1
+        for i in range(self.n):
+            determinant *= self.arr[i*(i+1)//2+i]
+        return determinant * determinant
+
+
+class GivensQR:
+    # Least squares by QR factorization, built one row at a time with Givens
+    # rotations. Only the p by p triangular factor R, the rotated targets
+    # Q^T y and the running residual sum of squares are kept, so memory does
+    # not grow with the number of rows and X^T X is never formed. The buffers
+    # are arrays of type_code, 'd' for fits that need the extra precision
+    # @micropython.native
+    def __init__(self, columns, outputs=1, type_code='f'):
+        self.columns = columns
+        self.outputs = outputs
+        self.rows = 0
+        self.type_code = type_code
+        self.R = zeros_array(type_code, columns*columns)
+        self.qty = zeros_array(type_code, columns*outputs)
+        self.rss = zeros_array(type_code, outputs)
+        # scratch copies of the row being rotated in
+        self.w = zeros_array(type_code, columns)
+        self.t = zeros_array(type_code, outputs)
+
+    # @micropython.native
+    # Purpose: to rotate the row already copied into the scratch buffers
+    # into R and Q^T y
+    # Parameters: self which is the GivensQR class
+    # returns: none
+    def rotate_in(self):
+        p = self.columns
+        k = self.outputs
+        R = self.R
+        qty = self.qty
+        w = self.w
+        t = self.t
+        for j in range(p):
+            wj = w[j]
+            if wj == 0:
+                continue
+            jp = j*p
+            rjj = R[jp+j]
+            r = sqrt(rjj*rjj + wj*wj)
+            c = rjj / r
+            s = wj / r
+            R[jp+j] = r
+            for l in range(j+1, p):
+                a = R[jp+l]
+                b = w[l]
+                R[jp+l] = c*a + s*b
+                w[l] = c*b - s*a
+            jk = j*k
+            for o in range(k):
+                a = qty[jk+o]
+                b = t[o]
+                qty[jk+o] = c*a + s*b
+                t[o] = c*b - s*a
+        for o in range(k):
+            self.rss[o] += t[o] * t[o]
+        self.rows += 1
+
+    # @micropython.native
+    # Purpose: to fold one observation into the factorization
+    # Parameters: self which is the GivensQR class, row which is a list or
+    # array of the p design values and y which is the target, a number or a
+    # list with one entry per output
+    # returns: none
+    def add_row(self, row, y):
+        for j in range(self.columns):
+            self.w[j] = row[j]
+        if self.outputs == 1 and not isinstance(y, (list, tuple, array)):
+            self.t[0] = y
+        else:
+            for o in range(self.outputs):
+                self.t[o] = y[o]
+        self.rotate_in()
+
+    # @micropython.native
+    # Purpose: to fold every row of a design matrix into the factorization
+    # without copying the rows out first
+    # Parameters: self which is the GivensQR class, x which is the design
+    # matrix and y which is the matrix of targets with one row per row of x
+    # returns: none
+    def add_rows(self, x, y):
+        xa = x.arr
+        ya = y.arr
+        xo, xrs, xcs = get_strides(x)
+        yo, yrs, ycs = get_strides(y)
+        w = self.w
+        t = self.t
+        for r in range(x.get_rows()):
+            i = xo + r*xrs
+            for j in range(self.columns):
+                w[j] = xa[i]
+                i += xcs
+            i = yo + r*yrs
+            for o in range(self.outputs):
+                t[o] = ya[i]
+                i += ycs
+            self.rotate_in()
+
+    # @micropython.native
+    # Purpose: to find the least squares coefficients by back substituting
+    # through R
+    # Parameters: self which is the GivensQR class
+    # returns: a p by outputs matrix of coefficients, or None if the design
+    # matrix seen so far is rank deficient
+    def solve(self):
+        p = self.columns
+        k = self.outputs
+        R = self.R
+        out = wrap_array(array(self.type_code, self.qty), p, k, self.type_code)
+        for i in range(p-1, -1, -1):
+            d = R[i*p+i]
+            if d == 0:
+                return None
+            for o in range(k):
+                s = out.arr[i*k+o]
+                for l in range(i+1, p):
+                    s -= R[i*p+l] * out.arr[l*k+o]
+                out.arr[i*k+o] = s / d
+        return out
+
+    # @micropython.native
+    # Purpose: to find the norm of the least squares residual y - x c, which
+    # the rotations accumulate as a by product
+    # Parameters: self which is the GivensQR class
+    # returns: the residual norm over all outputs
+    def residual_norm(self):
+        total = 0
+        for o in range(self.outputs):
+            total += self.rss[o]
+        return sqrt(total)
+
+
+class OnlineRegression:
+    # Linear regression that is updated one sample at a time, so a training
+    # loop never has to keep its samples around. Each sample is rotated into
+    # a GivensQR factorization, memory stays O(p^2) in the number of
+    # coefficients p and the current fit can be read at any point. alpha
+    # adds the same ridge term as get_alpha does for lin_regression and
+    # type_code is the type of the factorization's buffers
+    # @micropython.native
+    def __init__(self, features, outputs=1, bias=True, alpha=.0000001,
+                 type_code='f'):
+        self.features = features
+        self.bias = bias
+        self.samples = 0
+        p = features + 1 if bias else features
+        self.qr = GivensQR(p, outputs, type_code)
+        # Rotating in sqrt(alpha) * I with zero targets is the ridge
+        # penalty, and it keeps R solvable before p samples have been seen
+        if alpha > 0:
+            root = sqrt(alpha)
+            for i in range(p):
+                for j in range(p):
+                    self.qr.w[j] = root if i == j else 0
+                for o in range(outputs):
+                    self.qr.t[o] = 0
+                self.qr.rotate_in()
+
+    # @micropython.native
+    # Purpose: to fold one sample into the fit
+    # Parameters: self which is the OnlineRegression class, x which is a list
+    # or array of the features and y which is the target, a number or a list
+    # with one entry per output
+    # returns: none
+    def add_sample(self, x, y):
+        qr = self.qr
+        start = 0
+        if self.bias:
+            qr.w[0] = 1
+            start = 1
+        for j in range(self.features):
+            qr.w[start+j] = x[j]
+        if qr.outputs == 1 and not isinstance(y, (list, tuple, array)):
+            qr.t[0] = y
+        else:
+            for o in range(qr.outputs):
+                qr.t[o] = y[o]
+        qr.rotate_in()
+        self.samples += 1
+
+    # @micropython.native
+    # Purpose: to get the coefficients fitted to the samples seen so far
+    # Parameters: self which is the OnlineRegression class
+    # returns: a matrix with one row per coefficient, bias first, laid out
+    # like the result of lin_regression
+    def coefficients(self):
+        return self.qr.solve()
+
+
+class RLS:
+    # Recursive least squares estimator for adapting a linear model online.
+    # Each update is a rank one change to the inverse covariance P, so it
+    # costs O(p^2) and never re-inverts anything. forgetting is the factor
+    # lambda in (0, 1]: values below 1 discount old samples geometrically so
+    # the model tracks drift, 1 weights every sample equally. delta sets the
+    # starting P = delta * I, larger values trust the initial weights less.
+    # type_code is the type of P and the weights
+    # @micropython.native
+    def __init__(self, features, forgetting=1.0, delta=1000.0, bias=True,
+                 initial=None, type_code='f'):
+        self.features = features
+        self.bias = bias
+        self.forgetting = forgetting
+        p = features + 1 if bias else features
+        self.p = p
+        self.type_code = type_code
+        self.P = identity(p, type_code)
+        for i in range(p):
+            self.P[i*p+i] = delta
+        self.w = zeros_array(type_code, p)
+        if initial is not None:
+            # start from an existing fit, e.g. the result of lin_regression
+            for i in range(p):
+                if isinstance(initial, Matrix):
+                    self.w[i] = initial.get(i, 0)
+                else:
+                    self.w[i] = initial[i]
+        # scratch for the input vector and P x so updates don't allocate
+        self.x = zeros_array(type_code, p)
+        self.Px = zeros_array(type_code, p)
+
+    # @micropython.native
+    # Purpose: to copy the features, and the bias one, into the scratch
+    # input vector
+    # Parameters: self which is the RLS class and x which is a list or array
+    # of the features
+    # returns: the scratch input vector
+    def load(self, x):
+        v = self.x
+        start = 0
+        if self.bias:
+            v[0] = 1
+            start = 1
+        for j in range(self.features):
+            v[start+j] = x[j]
+        return v
+
+    # @micropython.native
+    # Purpose: to predict the target for one set of features
+    # Parameters: self which is the RLS class and x which is a list or array
+    # of the features
+    # returns: the prediction w . x
+    def predict(self, x):
+        v = self.load(x)
+        w = self.w
+        s = 0.0
+        for i in range(self.p):
+            s += w[i] * v[i]
+        return s
+
+    # @micropython.native
+    # Purpose: to update the model with one observed sample
+    # Parameters: self which is the RLS class, x which is a list or array of
+    # the features and y which is the observed target
+    # returns: the prediction error before the update
+    def update(self, x, y):
+        p = self.p
+        P = self.P
+        Px = self.Px
+        w = self.w
+        v = self.load(x)
+        denom = self.forgetting
+        err = y
+        for i in range(p):
+            s = 0.0
+            ip = i*p
+            for j in range(p):
+                s += P[ip+j] * v[j]
+            Px[i] = s
+            denom += v[i] * s
+            err -= w[i] * v[i]
+        # the gain is P x / (lambda + x^T P x)
+        scale = 1.0 / denom
+        inv = 1.0 / self.forgetting
+        for i in range(p):
+            w[i] += Px[i] * scale * err
+            # P - P x x^T P / denom is symmetric, so each entry is worked
+            # out once and mirrored. Rounding then can't make P lopsided,
+            # which 1 / lambda would amplify on every tick until it blows up
+            ip = i*p
+            for j in range(i, p):
+                e = (P[ip+j] - (Px[i] * Px[j]) * scale) * inv
+                P[ip+j] = e
+                P[j*p+i] = e
+        return err
+
+    # @micropython.native
+    # Purpose: to get the current weights
+    # Parameters: self which is the RLS class
+    # returns: a single column matrix of the weights, bias first, laid out
+    # like the result of lin_regression
+    def coefficients(self):
+        return wrap_array(array(self.type_code, self.w), self.p, 1,
+                          self.type_code)
+
 
 # a = Matrix([[3,8],[4,6]])
 # b = Matrix([[1,2],[3,4]])
@@ -349,7 +2709,6 @@ class Matrix:
 # print(a.clone())
 # print(b.get_inverse())
 # mv = memoryview(c.arr)
-# print(get_matrix_minor(mv, 1,1,3))
 # print(c.determinant())
 # print(c.get_inverse())
 #
@@ -364,24 +2723,89 @@ Xs =  Matrix(xs)
 Ys = Matrix(ys)
 # # @micropython.native
 def get_alpha(n):
-    alpha = Matrix()
-    for i in range(n):
-        alpha.add_row([.0000001 if i == j else 0 for j in range(n)])
-    return alpha
-#
-# # @micropython.native
-def lin_regression(x, y):
-    x = x.add_bias_ones()
-    xT = x.T()
+    return Matrix.eye(n).imul_scalar(.0000001)
+
+# @micropython.native
+# Purpose: to solve the ridge normal equations (alpha + xT * x) c = xT * y
+# Parameters: gram which is alpha + xT * x and xty which is xT * y
+# returns: the coefficients. Cholesky is used since gram is symmetric
+# positive definite, falling back to LU if rounding has made it indefinite
+def solve_normal(gram, xty):
+    out = gram.solve_spd(xty)
+    if out is None:
+        out = gram.factorize().solve_many(xty)
+    return out
+
+# @micropython.native
+# Purpose: to fit a least squares model directly to a design matrix, such as
+# one built by add_bias_ones or polynomialize
+# Parameters: x which is the design matrix, y which is the matrix of targets
+# and method which is 'qr' to stream the rows through Givens rotations or
+# 'normal' to solve the ridge normal equations. 'qr' never forms xT * x so
+# it keeps the accuracy that squaring the condition number throws away
+# returns: the coefficients and the norm of the residual y - x * c
+def lstsq(x, y, method='qr'):
+    if method == 'qr':
+        qr = GivensQR(x.get_columns(), y.get_columns(),
+                      float_type(promote(x.type_code, y.type_code)))
+        qr.add_rows(x, y)
+        return qr.solve(), qr.residual_norm()
+    if method != 'normal':
+        raise ValueError("method should be 'qr' or 'normal'")
     alpha = get_alpha(x.get_columns())
-    return (alpha + (xT * x)).get_inverse() * xT * y
+    c = solve_normal(x.gram().iadd(alpha), x.tmul(y))
+    total = 0
+    for r in range(x.get_rows()):
+        for o in range(y.get_columns()):
+            e = y.get(r, o)
+            for j in range(x.get_columns()):
+                e -= x.get(r, j) * c.get(j, o)
+            total += e * e
+    return c, sqrt(total)
+
+# @micropython.native
+# Purpose: to fit a least squares model on an expansion of the raw features
+# Parameters: expansion which is a PolynomialFeatures, x which is the matrix
+# of raw features, y which is the matrix of targets and method which is
+# 'normal' or 'qr' as for lstsq
+# returns: the coefficients, one row per column of the expansion. When the
+# expansion scales its inputs they are folded back onto the raw features
+def fit_features(expansion, x, y, method='normal'):
+    x = expansion.transform(x)
+    if method != 'normal':
+        c = lstsq(x, y, method)[0]
+    else:
+        alpha = get_alpha(x.get_columns())
+        c = solve_normal(x.gram().iadd(alpha), x.tmul(y))
+    if c is not None and expansion.scaler is not None:
+        c = expansion.fold(c)
+    return c
+
+# @micropython.native
+# Purpose: to make the scaler the regressions fit with
+# Parameters: x which is the matrix of raw features and scale which is None,
+# 'standard' or 'minmax'
+# returns: a Scaler fitted to x, or None when scale is None
+def fit_scaler(x, scale):
+    if scale is None:
+        return None
+    return Scaler(x.get_columns(), scale).fit(x)
 
 # # @micropython.native
-def poly_regression(x, y, degree):
-    x = x.polynomialize(degree)
-    xT = x.T()
-    alpha = get_alpha(x.get_columns())
-    return (alpha + xT * x).get_inverse() * xT * y
+# scale='standard' or 'minmax' fits on scaled features, which keeps high
+# powers of raw intensities well conditioned, and still returns coefficients
+# that take the raw features
+def lin_regression(x, y, method='normal', scale=None):
+    expansion = PolynomialFeatures(x.get_columns(), 1,
+                                   scaler=fit_scaler(x, scale))
+    return fit_features(expansion, x, y, method)
+
+# # @micropython.native
+def poly_regression(x, y, degree, method='normal', interactions=False,
+                    scale=None):
+    expansion = PolynomialFeatures(x.get_columns(), degree, interactions,
+                                   scaler=fit_scaler(x, scale))
+    return fit_features(expansion, x, y, method)
 #
 # # @micropython.native
 def LDF(x, y):
@@ -390,128 +2814,14 @@ def LDF(x, y):
     return aT*x
 
 #--------------------------------Big O TESTING----------------------------------
+# Timings are in benchmark.py, run it with `python benchmark.py`
 
-# arr = Matrix([[3,8],[4,6]])
-# arr1 = Matrix([[8,90,888,202],[55,677,899,544],[3,4,5,6],[77,876,900,11.2]])
-# arr2 = Matrix([[8,90,888,202,55,677],[899,544,3,4,5,6],[77,876,900,11.2,85,76],[22,32,12,11,44,52],[70,38,9,111,2,65],[32,12,999,87,65,45]])
-# arr3 = Matrix([[8,90,888,202,55,677,899,544],[3,4,5,6,77,876,900,11.2],[85,76,22,32,12,11,44,52],[70,38,9,111,2,65,32,12],[999,87,65,45,69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128], [19.801177481341924, 16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224], [24.657078293121803, 44.62451863254328, 46.36020966840929, 42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871], [23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609, 22,566,777]])
-# arr4 = Matrix([[67.77472353218393, 88.13098577413399, 42.52930638931034, 37.5432806277281, 1.9198458039374589, 95.64210152543843, 26.949504997381247, 4.009564303303248, 8.80509597940209, 39.79363879960982], [35.22092471535084, 39.587780219127154, 45.51274216523215, 54.12805293908667, 47.18181666996103, 93.02835319332387, 31.13950562616774, 59.7201510037116, 53.80654305953264, 28.287518357163055], [60.907829142815714, 55.76053745287567, 85.95283416834502, 90.59405475757596, 9.171543655741898, 23.025560679907777, 60.99942588993682, 37.49909274641523, 12.382262103698116, 48.1340567049508], [59.810056065284186, 55.69024159681184, 26.472862346215685, 55.64166467054768, 98.25844497890856, 67.45911742045018, 35.70496846044291, 34.53169412582007, 84.34463972723368, 61.613497631901915], [66.50117081869747, 53.66378204285315, 52.51150387842664, 75.24835517166078, 58.08863674988469, 17.82671979420205, 74.87713609834073, 32.001925460763466, 3.2125461538568656, 19.334962956074985], [49.847395753673204, 1.191178612719479, 9.880892601113356, 95.52218273763998, 27.807248036544173, 16.102315812701406, 5.777375785533733, 9.44901880427782, 6.017851911013605, 49.081003991780825], [22.471509132751898, 51.54633680998347, 7.225774728437839, 14.605177598825103, 90.07781382345678, 74.90636996433466, 1.7946030180889916, 46.15424242576249, 12.845219231094863, 11.914080644846049], [90.08027263782967, 22.493566306822455, 53.5641400860013, 97.63601172202887, 32.78747204720162, 69.6925976472022, 85.45179074365242, 11.663933878634381, 89.27638992007128, 19.801177481341924], [16.790799071367513, 44.2391504467045, 26.630908026211365, 81.30459627802874, 7.433336204865048, 70.3730079097495, 71.06472385641224, 24.657078293121803, 44.62451863254328, 46.36020966840929], [42.66378952325833, 72.85396068492615, 90.99104096999713, 36.24184082636711, 13.558126557876871, 23.49921021097202, 35.8666270288227, 54.71996671248777, 85.71856624768702, 58.90638731181609]])
-# tot = [arr,arr1,arr2,arr3,arr4]
-# totlen = [2,4,6,8,10]
-
-
-print(lin_regression(Xs, Ys))
-print("linear regression complete")
-print(poly_regression(Xs, Ys, 2))
-print("polynomial(2) regression complete")
-print(poly_regression(Xs, Ys, 3))
-print("polynomial(3) regression complete")
-print(poly_regression(Xs, Ys, 4))
-print("polynomial(4) regression complete")
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = get_matrix_minor(tot[i].arr,0,0,totlen[i])
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = determinant_helper(tot[i].arr, totlen[i])
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# out = array('f')
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = transpose_matrix(tot[i].arr, totlen[i], totlen[i], out)
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = inverse_helper(tot[i].arr, totlen[i])
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = Matrix(tot[i].arr)
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].T()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# row = [1,2]
-# row1 = [1,2,3,4]
-# row2 = [1,2,3,4,5,6]
-# row3 = [1,2,3,4,5,6,7,8]
-# row4 = [1,2,3,4,5,6,7,8,9,10]
-# totrow = [row,row1,row2,row3,row4]
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].add_row(totrow[i])
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].extend(tot[i].arr)
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].get(i, i)
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].get_rows()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].get_columns()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].clone()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i]+tot[i]
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i]*tot[i]
-#     et = datetime.datetime.now()
-#     print(et - st)
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].determinant()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     out = tot[i].get_inverse()
-#     et = datetime.datetime.now()
-#     print(et - st)
-#
-# for i in range(5):
-#     st = datetime.datetime.now()
-#     print(tot[i])
-#     et = datetime.datetime.now()
-#     print(et - st)
+if __name__ == '__main__':
+    print(lin_regression(Xs, Ys))
+    print("linear regression complete")
+    print(poly_regression(Xs, Ys, 2))
+    print("polynomial(2) regression complete")
+    print(poly_regression(Xs, Ys, 3))
+    print("polynomial(3) regression complete")
+    print(poly_regression(Xs, Ys, 4))
+    print("polynomial(4) regression complete")
@@ -0,0 +1,107 @@
+# The NumPy backend has to give the same results, and raise the same errors,
+# as the pure Python kernels the hub runs
+import random
+
+import pytest
+
+import matrix_v3 as matrix
+
+pytestmark = pytest.mark.skipif(matrix.numpy is None,
+                                reason='numpy is not installed')
+
+
+# Purpose: to run fn once under each backend, with every operation big
+# enough to go to NumPy under the NumPy one
+# Parameters: fn which takes no arguments
+# returns: a list of what fn returned or the type of error it raised, one
+# entry per backend
+def both(fn):
+    outcomes = []
+    previous = matrix.get_backend()
+    min_size = matrix.NUMPY_MIN_SIZE
+    matrix.NUMPY_MIN_SIZE = 0
+    try:
+        for backend in matrix.BACKENDS:
+            matrix.set_backend(backend)
+            try:
+                outcomes.append(fn())
+            except Exception as e:
+                outcomes.append(type(e))
+    finally:
+        matrix.set_backend(previous)
+        matrix.NUMPY_MIN_SIZE = min_size
+    return outcomes
+
+
+def entries(m):
+    return [m.get(r, c) for r in range(m.get_rows())
+            for c in range(m.get_columns())]
+
+
+def make(rows, columns, low, high, type_code, seed=3):
+    rng = random.Random(seed)
+    return matrix.Matrix([[rng.randint(low, high) for c in range(columns)]
+                          for r in range(rows)], type_code)
+
+
+def test_results_match():
+    a = make(12, 10, -40, 40, 'f')
+    b = make(12, 10, 1, 9, 'f', 4)
+    h = make(12, 10, -300, 300, 'h')
+    ops = [
+        lambda: a + b, lambda: a - b.T().T(), lambda: a.multiply(b),
+        lambda: a / b, lambda: b ** 2, lambda: a * 2.5, lambda: h * 3,
+        lambda: a * b.T(), lambda: h * h.T(), lambda: h.multiply(h),
+        lambda: h * 300,
+        lambda: a.gram(), lambda: a.tmul(b), lambda: abs(h),
+        lambda: h.clip(-100, 100), lambda: h.clip(None, 100),
+        lambda: h.clip(-100), lambda: h.clip(), lambda: a.clip(None, 2.5),
+        lambda: a + b.row(0),
+    ]
+    for op in ops:
+        python, numpy_result = both(lambda: entries(op()))
+        assert len(python) == len(numpy_result)
+        for x, y in zip(python, numpy_result):
+            assert abs(x - y) <= 1e-5 * (1 + abs(x))
+
+
+def test_integer_overflow_raises():
+    big = make(8, 8, 40000, 50000, 'i')
+    h = make(8, 8, 200, 300, 'h')
+    for op in (lambda: big.multiply(big), lambda: big * big,
+               lambda: h * 10000000, lambda: big + big * 50000):
+        assert both(op) == [OverflowError, OverflowError]
+    low = matrix.Matrix.full(8, 8, -32768, 'h')
+    assert both(lambda: abs(low)) == [OverflowError, OverflowError]
+
+
+def test_floats_into_integer_rows_raise():
+    rows = [[0.5 * (r + c) for c in range(10)] for r in range(10)]
+    assert both(lambda: matrix.Matrix(rows, 'h')) == [TypeError, TypeError]
+    h = make(12, 10, -300, 300, 'h')
+    for op in (lambda: h.clip(None, 2.5), lambda: h.clip(-2.5)):
+        assert both(op) == [TypeError, TypeError]
+
+
+def test_division_by_zero_raises():
+    a = make(8, 8, 1, 9, 'i')
+    zeros = matrix.Matrix.zeros(8, 8, 'i')
+    for op in (lambda: a / zeros, lambda: a / 0, lambda: 1 / zeros,
+               lambda: zeros ** -1):
+        assert both(op) == [ZeroDivisionError, ZeroDivisionError]
+
+
+def test_products_of_short_integers_widen():
+    h = make(12, 10, 200, 300, 'h')
+    for op in (lambda: h.multiply(h), lambda: h * 300, lambda: h * h.T()):
+        python, numpy_result = both(lambda: op().type_code)
+        assert python == numpy_result == 'i'
+    assert both(lambda: (h + h).type_code) == ['h', 'h']
+
+
+def test_mismatched_products_raise():
+    row = matrix.Matrix([[1, 2, 3]])
+    square = matrix.Matrix([[1, 2], [3, 4]])
+    for op in (lambda: row * row, lambda: square * row,
+               lambda: square.tmul(row.T())):
+        assert both(op) == [ValueError, ValueError]
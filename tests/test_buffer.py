@@ -0,0 +1,29 @@
+# Matrices over existing buffers with Matrix.from_buffer
+from array import array
+
+import pytest
+
+import matrix_v3 as matrix
+
+
+class NoCast:
+    # a memoryview without cast, like MicroPython's
+    def __init__(self, buf):
+        self.buf = buf
+
+
+def test_buffer_is_shared():
+    buf = bytearray(array('f', [1, 2, 3, 4]).tobytes())
+    m = matrix.Matrix.from_buffer(buf, 2, 2)
+    m[1, 0] = 7
+    assert array('f', bytes(buf))[2] == 7
+
+
+def test_untyped_buffer_without_cast_raises(monkeypatch):
+    monkeypatch.setattr(matrix, 'memoryview', NoCast, raising=False)
+    typed = array('f', [1, 2, 3, 4])
+    assert matrix.buffer_array(typed, 'f') is typed
+    with pytest.raises(ValueError):
+        matrix.buffer_array(array('h', [1, 2, 3, 4]), 'f')
+    with pytest.raises(ValueError):
+        matrix.buffer_array(bytearray(6), 'f')
@@ -0,0 +1,30 @@
+# Reading sample files with matrix_dataset
+import matrix_v3 as matrix
+import matrix_dataset
+
+
+def test_saved_matrix_rows_come_from_the_header(tmp_path):
+    samples = matrix.Matrix([[1, 2], [3, 4]])
+    path = str(tmp_path / 'samples.bin')
+    with open(path, 'wb') as f:
+        samples.save(f)
+        matrix.Matrix([[9, 9], [9, 9], [9, 9]]).save(f)
+    for use_mmap in (True, False):
+        with matrix_dataset.Dataset(path, use_mmap=use_mmap) as data:
+            assert data.rows == 2
+            seen = [x.get(r, 0) for x, y in data.chunks()
+                    for r in range(x.get_rows())]
+            assert seen == [1, 3]
+
+
+def test_partial_trailing_entry_is_ignored(tmp_path):
+    rows = matrix.Matrix([[1, 2, 3], [4, 5, 6]])
+    path = tmp_path / 'log.bin'
+    path.write_bytes(bytes(rows.arr) + b'\x01\x02')
+    for use_mmap in (True, False):
+        with matrix_dataset.Dataset(str(path), columns=3,
+                                    use_mmap=use_mmap) as data:
+            assert data.rows == 2
+            chunks = list(data.chunks())
+            assert chunks[-1][1].get(1, 0) == 6
+            del chunks
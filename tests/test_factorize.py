@@ -0,0 +1,31 @@
+# The cached LU factorization has to follow writes made through any matrix
+# sharing the array
+import matrix_v3 as matrix
+
+
+def make():
+    return matrix.Matrix([[4, 3], [6, 5]], 'd')
+
+
+def test_write_drops_cache_of_transpose():
+    a = make()
+    t = a.T()
+    assert abs(t.factorize().determinant() - 2) < 1e-9
+    a[0, 0] = 10
+    assert abs(t.factorize().determinant() - 32) < 1e-9
+
+
+def test_write_through_view_drops_cache():
+    a = make()
+    assert abs(a.factorize().determinant() - 2) < 1e-9
+    a.row(0)[0, 1] = 1
+    assert abs(a.factorize().determinant() - 14) < 1e-9
+    a.T().iadd(matrix.Matrix.eye(2, 'd'))
+    assert abs(a.factorize().determinant() - 24) < 1e-9
+
+
+def test_unchanged_matrix_keeps_cache():
+    a = make()
+    lu = a.factorize()
+    a.T().gram()
+    assert a.factorize() is lu
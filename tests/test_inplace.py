@@ -0,0 +1,38 @@
+# In place updates refuse operands of the wrong shape before writing
+import pytest
+
+import matrix_v3 as matrix
+
+
+def entries(m):
+    return [m.get(r, c) for r in range(m.get_rows())
+            for c in range(m.get_columns())]
+
+
+def test_iadd_checks_shapes():
+    a = matrix.Matrix([[1, 2, 3], [4, 5, 6]])
+    with pytest.raises(ValueError):
+        a.iadd(a.T().clone())
+    assert entries(a) == [1, 2, 3, 4, 5, 6]
+    a.iadd(a.T().T())
+    assert entries(a) == [2, 4, 6, 8, 10, 12]
+
+
+def test_block_assignment_checks_shapes():
+    a = matrix.Matrix.zeros(3, 3)
+    with pytest.raises(ValueError):
+        a[0:2, 0:2] = matrix.Matrix([[1, 2, 3], [4, 5, 6]])
+    assert entries(a) == [0] * 9
+    a[1:3, 0:2] = matrix.Matrix([[1, 2], [3, 4]])
+    assert entries(a) == [0, 0, 0, 1, 2, 0, 3, 4, 0]
+
+
+def test_reflected_operators():
+    a = matrix.Matrix([[1, 2], [4, 8]])
+    assert entries(2 + a) == [3, 4, 6, 10]
+    assert entries(2 - a) == [1, 0, -2, -6]
+    assert entries(8 / a) == [8, 4, 2, 1]
+    assert entries(2 * a) == [2, 4, 8, 16]
+    assert entries(0.5 * a) == [0.5, 1, 2, 4]
+    h = matrix.Matrix([[1, 2], [4, 8]], 'h')
+    assert (3 * h).type_code == 'i' and (0.5 * h).type_code == 'f'
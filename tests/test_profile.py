@@ -0,0 +1,17 @@
+# What matrix_profile counts as allocated
+import matrix_v3 as matrix
+import matrix_profile
+
+
+def test_views_and_reused_buffers_allocate_nothing():
+    a = matrix.Matrix([[1, 2, 3], [4, 5, 6]])
+    out = a.clone()
+    with matrix_profile.Profile() as p:
+        for i in range(10):
+            a.T()
+        for i in range(3):
+            a.__add__(a, out)
+        a.clone()
+    assert p.stats['Matrix.T'][3] == 0
+    assert p.stats['Matrix.__add__'][3] == 0
+    assert p.stats['Matrix.clone'][3] == 6
@@ -0,0 +1,39 @@
+# Long running checks of the RLS estimator used in the control loop
+import random
+
+import matrix_v3 as matrix
+
+
+# Purpose: to run an RLS estimator for many ticks on noisy sensor like data
+# Parameters: forgetting which is the RLS forgetting factor, type_code of
+# its buffers and ticks which is how many updates to make
+# returns: the estimator after the last update
+def run_rls(forgetting, type_code, ticks=20000):
+    rng = random.Random(7)
+    rls = matrix.RLS(3, forgetting, type_code=type_code)
+    for t in range(ticks):
+        x = [rng.uniform(0, 600), rng.uniform(0, 350), rng.uniform(0, 300)]
+        y = 2 + 0.3*x[0] - 0.2*x[1] + 0.1*x[2] + rng.gauss(0, 1)
+        rls.update(x, y)
+    return rls
+
+
+def check_covariance(rls):
+    p = rls.p
+    P = matrix.wrap_array(rls.P, p, p, rls.type_code)
+    for i in range(p):
+        for j in range(p):
+            assert P.get(i, j) == P.get(j, i)
+    assert P.cholesky() is not None
+
+
+def test_covariance_stays_symmetric_positive_definite_double():
+    for forgetting in (0.98, 0.95):
+        check_covariance(run_rls(forgetting, 'd'))
+
+
+def test_covariance_stays_symmetric_positive_definite_float():
+    for forgetting in (0.98, 0.95):
+        rls = run_rls(forgetting, 'f')
+        check_covariance(rls)
+        assert abs(rls.coefficients().get(1, 0) - 0.3) < 0.01
@@ -0,0 +1,82 @@
+# Matrix.save and Matrix.load round trips and bad input
+import io
+import struct
+
+import pytest
+
+import matrix_v3 as matrix
+
+
+def entries(m):
+    return [m.get(r, c) for r in range(m.get_rows())
+            for c in range(m.get_columns())]
+
+
+def round_trip(m):
+    f = io.BytesIO()
+    m.save(f)
+    f.seek(0)
+    return matrix.Matrix.load(f)
+
+
+def make(type_code):
+    return matrix.Matrix([[1, -2, 3, 4], [5, 6, -7, 8], [9, 10, 11, -12]],
+                         type_code)
+
+
+@pytest.mark.parametrize('type_code', ['h', 'i', 'f', 'd'])
+def test_round_trip_keeps_entries_and_type(type_code):
+    m = make(type_code)
+    for view in (m, m.T(), m.block(1, 1, 2, 3), m.T().block(1, 0, 2, 2),
+                 m.row(2), m.col(1)):
+        loaded = round_trip(view)
+        assert loaded.type_code == type_code
+        assert (loaded.get_rows(), loaded.get_columns()) == (
+            view.get_rows(), view.get_columns())
+        assert entries(loaded) == entries(view)
+
+
+def test_transposed_view_is_saved_column_by_column():
+    m = make('f')
+    f = io.BytesIO()
+    m.T().save(f)
+    type_code, flags, rows, columns = matrix.Matrix.load_header(
+        io.BytesIO(f.getvalue()))
+    assert flags & matrix.TRANSPOSED
+    assert (rows, columns) == (4, 3)
+    assert len(f.getvalue()) == matrix.HEADER_SIZE + 12 * 4
+
+
+def test_path_and_out_buffer(tmp_path):
+    path = str(tmp_path / 'm.bin')
+    make('d').save(path)
+    out = matrix.Matrix.zeros(3, 4, 'd')
+    arr = out.arr
+    loaded = matrix.Matrix.load(path, out)
+    assert loaded is out and out.arr is arr
+    assert entries(out) == entries(make('d'))
+
+
+def test_truncated_and_junk_input_raise():
+    f = io.BytesIO()
+    make('i').save(f)
+    data = f.getvalue()
+    bad = [
+        data[:matrix.HEADER_SIZE - 1],
+        data[:-1],
+        b'junk' + data[4:],
+        b'',
+        b'\x00' * 64,
+        data[:4] + bytes([matrix.FORMAT_VERSION + 1]) + data[5:],
+        data[:5] + b'x' + data[6:],
+    ]
+    for junk in bad:
+        with pytest.raises(ValueError):
+            matrix.Matrix.load(io.BytesIO(junk))
+
+
+def test_header_layout():
+    f = io.BytesIO()
+    matrix.Matrix([[1, 2]], 'h').save(f)
+    assert struct.unpack(matrix.HEADER, f.getvalue()[:matrix.HEADER_SIZE]) == (
+        matrix.MAGIC, matrix.FORMAT_VERSION, ord('h'), 0, 0, 1, 2)
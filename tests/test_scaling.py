@@ -0,0 +1,61 @@
+# Fits on scaled features fold back to coefficients on the raw features, so
+# they match the fit made on the raw features directly
+import random
+
+import pytest
+
+import matrix_v3 as matrix
+
+
+def samples(degree, interactions, rows=60, seed=7):
+    rng = random.Random(seed)
+    x = matrix.Matrix([[rng.uniform(0.5, 3.0), rng.uniform(-2.0, 4.0)]
+                       for r in range(rows)], 'd')
+    expansion = matrix.PolynomialFeatures(2, degree, interactions)
+    truth = matrix.Matrix([rng.uniform(-2.0, 2.0)
+                           for t in range(expansion.width)], 'd')
+    return x, expansion.transform(x) * truth, truth
+
+
+def entries(m):
+    return [m.get(r, 0) for r in range(m.get_rows())]
+
+
+# QR solves exactly, so the folded coefficients are exact to rounding. The
+# normal equations carry get_alpha's ridge term, which biases a fit on
+# minmax scaled cubes, all crowded into [0, 1], by a few parts in 10^4
+TOLERANCE = {'qr': 1e-9, 'normal': 2e-3}
+
+
+@pytest.mark.parametrize('degree', [2, 3])
+@pytest.mark.parametrize('interactions', [False, True])
+@pytest.mark.parametrize('scale', ['standard', 'minmax'])
+@pytest.mark.parametrize('method', ['normal', 'qr'])
+def test_scaled_fit_matches_raw_fit(degree, interactions, scale, method):
+    x, y, truth = samples(degree, interactions)
+    raw = matrix.poly_regression(x, y, degree, method, interactions)
+    scaled = matrix.poly_regression(x, y, degree, method, interactions,
+                                    scale)
+    assert scaled.get_rows() == raw.get_rows() == truth.get_rows()
+    tolerance = TOLERANCE[method]
+    for s, r, t in zip(entries(scaled), entries(raw), entries(truth)):
+        assert abs(s - t) < tolerance * (1 + abs(t))
+        assert abs(s - r) < tolerance * (1 + abs(r))
+
+
+@pytest.mark.parametrize('scale', ['standard', 'minmax'])
+def test_scaled_linear_fit_matches_raw_fit(scale):
+    x, y, truth = samples(1, False)
+    raw = matrix.lin_regression(x, y)
+    scaled = matrix.lin_regression(x, y, scale=scale)
+    for s, r in zip(entries(scaled), entries(raw)):
+        assert abs(s - r) < 1e-5 * (1 + abs(r))
+
+
+def test_scaler_modes():
+    x = matrix.Matrix([[1, 10], [3, 30], [5, 50]], 'd')
+    standard = matrix.Scaler(2).fit(x).transform(x)
+    assert [standard.get(r, 1) for r in range(3)] == pytest.approx(
+        [-1.224744871, 0, 1.224744871])
+    minmax = matrix.Scaler(2, 'minmax').fit(x).transform(x)
+    assert [minmax.get(r, 0) for r in range(3)] == pytest.approx([0, .5, 1])
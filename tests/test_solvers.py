@@ -0,0 +1,93 @@
+# Inverses, determinants and the LU, Cholesky and QR solvers
+import random
+
+import pytest
+
+import matrix_v3 as matrix
+
+
+def entries(m):
+    return [m.get(r, c) for r in range(m.get_rows())
+            for c in range(m.get_columns())]
+
+
+def close(xs, ys, tolerance=1e-9):
+    return all(abs(x - y) <= tolerance * (1 + abs(y)) for x, y in zip(xs, ys))
+
+
+# needs row swaps, the first pivot is zero
+PIVOTING = [[0, 2, 1], [1, 1, 0], [2, 0, 3]]
+SPD = [[4, 1, 2], [1, 3, 0], [2, 0, 5]]
+IDENTITY = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+
+
+def test_pivoting_inverse():
+    a = matrix.Matrix(PIVOTING, 'd')
+    inv = a.get_inverse()
+    assert close(entries(a * inv), IDENTITY)
+    assert close(entries(inv * a), IDENTITY)
+    assert entries(a) == [0, 2, 1, 1, 1, 0, 2, 0, 3]
+    assert 0 < inv.rcond <= 1
+    t = a.T().get_inverse()
+    assert close(entries(a.T() * t), IDENTITY)
+    a.get_inverse(inplace=True)
+    assert close(entries(a), entries(inv))
+
+
+def test_singular_inverse():
+    assert matrix.Matrix([[1, 2], [2, 4]], 'd').get_inverse() is None
+    # an integer matrix and a block are reduced in a copy, so a failed
+    # inverse leaves them as they were
+    ints = matrix.Matrix([[1, 2], [2, 4]], 'i')
+    assert ints.get_inverse(inplace=True) is None
+    assert ints.type_code == 'i' and entries(ints) == [1, 2, 2, 4]
+    big = matrix.Matrix([[1, 2, 0], [2, 4, 0], [0, 0, 1]], 'd')
+    block = big.block(0, 0, 2, 2)
+    assert block.get_inverse(inplace=True) is None
+    assert entries(big) == [1, 2, 0, 2, 4, 0, 0, 0, 1]
+
+
+def test_lu_solve_and_determinant():
+    a = matrix.Matrix(PIVOTING, 'd')
+    lu = a.factorize()
+    assert abs(lu.determinant() - a.determinant()) < 1e-12
+    assert abs(a.determinant() - -8) < 1e-12
+    x = lu.solve([3, 2, 5])
+    assert close(entries(a * x), [3, 2, 5])
+    b = matrix.Matrix([[1, 0], [0, 1], [1, 1]], 'd')
+    assert close(entries(a * lu.solve_many(b)), entries(b))
+    assert close(entries(lu.inverse()), entries(a.get_inverse()))
+    assert matrix.Matrix([[1, 2], [2, 4]], 'd').factorize().solve([1, 1]) is None
+
+
+def test_cholesky_solve():
+    a = matrix.Matrix(SPD, 'd')
+    x = a.solve_spd([1, 2, 3])
+    assert close(entries(a * x), [1, 2, 3])
+    assert abs(a.cholesky().determinant() - a.determinant()) < 1e-9
+    b = matrix.Matrix([[1, 2], [0, 1], [3, 0]], 'd')
+    assert close(entries(a * a.solve_spd(b)), entries(b))
+    assert matrix.Matrix(PIVOTING, 'd').cholesky() is None
+
+
+@pytest.mark.parametrize('method', ['qr', 'normal'])
+def test_least_squares(method):
+    rng = random.Random(3)
+    x = matrix.Matrix([[1, rng.uniform(-5, 5), rng.uniform(0, 2)]
+                       for r in range(40)], 'd')
+    truth = matrix.Matrix([[1.5, -2], [-0.5, 1], [2, 0.25]], 'd')
+    y = x * truth
+    c, residual = matrix.lstsq(x, y, method)
+    assert close(entries(c), entries(truth), 1e-6)
+    assert residual < 1e-5
+
+
+def test_qr_streams_rows():
+    rng = random.Random(4)
+    x = matrix.Matrix([[1, rng.uniform(-1, 1)] for r in range(30)], 'd')
+    y = x * matrix.Matrix([2, -3], 'd')
+    qr = matrix.GivensQR(2, 1, 'd')
+    for start in range(0, 30, 7):
+        n = min(7, 30 - start)
+        qr.add_rows(x.block(start, 0, n, 2), y.block(start, 0, n, 1))
+    assert close(entries(qr.solve()), [2, -3])
@@ -0,0 +1,18 @@
+# Views share their parent's array, empty matrices each own theirs
+import matrix_v3 as matrix
+
+
+def test_empty_matrices_do_not_share_an_array():
+    matrix.Matrix().arr.append(5)
+    matrix.Matrix().add_row([1, 2])
+    assert len(matrix.Matrix().arr) == 0
+    assert len(matrix.Matrix(None, 'h').arr) == 0
+    assert matrix.Matrix().arr is not matrix.Matrix().arr
+
+
+def test_views_share_the_array():
+    a = matrix.Matrix([[1, 2, 3], [4, 5, 6]])
+    t = a.T()
+    assert t.arr is a.arr
+    t[2, 0] = 9
+    assert a.get(0, 2) == 9